@@ -0,0 +1,631 @@
+#!/usr/bin/env python
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+# Benchmarks for submitter. These run offline against a mocked S3 and a fake
+# collector running locally.
+#
+# Results are printed to stdout as JSON for tracking regressions.
+#
+# Usage: ./bin/benchmark.py COMMAND [OPTIONS]
+
+import argparse
+import functools
+import http.server
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Configuration for running submitter against mocked S3
+BENCHMARK_ENV = {
+    "SUBMITTER_ENV_NAME": "benchmark",
+    "SUBMITTER_S3_BUCKET": "benchmark-bucket",
+    "SUBMITTER_S3_REGION_NAME": "us-east-1",
+    "SUBMITTER_S3_ACCESS_KEY": "foo",
+    "SUBMITTER_S3_SECRET_ACCESS_KEY": "foo",
+    "SUBMITTER_DESTINATIONS": "http://antenna:8000/submit|100",
+}
+
+MB = 1024 * 1024
+
+
+def import_submitter():
+    """Sets up the environment and imports submitter from src/"""
+    for key, val in BENCHMARK_ENV.items():
+        os.environ.setdefault(key, val)
+    sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+
+    import submitter
+
+    return submitter
+
+
+def measure(func, iterations):
+    """Calls func iterations times and measures time and Python memory
+
+    :returns: dict with ``ms`` (mean milliseconds per call) and ``peak_bytes``
+        (peak traced memory for a single call)
+
+    """
+    # Measure time without tracemalloc overhead
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    ms = (time.perf_counter() - start) * 1000 / iterations
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"ms": round(ms, 3), "peak_bytes": peak_bytes}
+
+
+def cmd_s3fetch(args):
+    """Compares memory used fetching objects from S3"""
+    from moto import mock_s3
+
+    submitter = import_submitter()
+
+    def download_fileobj(client, bucket, key):
+        # What s3_fetch did originally
+        data = io.BytesIO()
+        client.download_fileobj(bucket, key, data)
+        return data.getvalue()
+
+    strategies = {
+        "download_fileobj": download_fileobj,
+        "s3_fetch": submitter.s3_fetch,
+    }
+
+    results = []
+    with mock_s3():
+        client = submitter.get_s3_client()
+        bucket = submitter.CONFIG.s3_bucket
+        client.create_bucket(Bucket=bucket)
+
+        for size_mb in args.sizes:
+            size = int(size_mb * MB)
+            key = "v1/dump/benchmark-%d" % size
+            client.put_object(Bucket=bucket, Key=key, Body=os.urandom(size))
+
+            for name, fetch in strategies.items():
+                result = measure(
+                    functools.partial(fetch, client, bucket, key), args.iterations
+                )
+                result.update(
+                    {
+                        "strategy": name,
+                        "size_bytes": size,
+                        "peak_ratio": round(result["peak_bytes"] / size, 2),
+                    }
+                )
+                results.append(result)
+
+    return {"benchmark": "s3fetch", "results": results}
+
+
+def parse_importtime(output):
+    """Parses ``python -X importtime`` output for importing submitter
+
+    :arg output: the stderr output
+
+    :returns: tuple of (cumulative microseconds for submitter, list of
+        (module, cumulative microseconds) for modules submitter imports
+        directly)
+
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:") :].split("|")
+        level = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((level, name.strip(), int(cumulative_us)))
+
+    # Entries for a module's imports come before the module, so walk backwards
+    # from submitter to find what it imports directly
+    index = max(i for i, entry in enumerate(entries) if entry[:2] == (0, "submitter"))
+    direct_imports = []
+    for level, name, cumulative_us in reversed(entries[:index]):
+        if level == 0:
+            break
+        if level == 1:
+            direct_imports.append((name, cumulative_us))
+
+    return entries[index][2], direct_imports
+
+
+def cmd_importtime(args):
+    """Measures how long importing submitter takes in a new Python process"""
+    env = dict(os.environ)
+    env.update(BENCHMARK_ENV)
+    env["PYTHONPATH"] = os.path.join(REPO_ROOT, "src")
+
+    runs = []
+    for _ in range(args.iterations):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import submitter"],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        runs.append(parse_importtime(proc.stderr))
+
+    runs.sort(key=lambda run: run[0])
+    median_us, direct_imports = runs[len(runs) // 2]
+    direct_imports.sort(key=lambda item: item[1], reverse=True)
+
+    return {
+        "benchmark": "importtime",
+        "python": platform.python_version(),
+        "iterations": args.iterations,
+        "import_us": {
+            "min": runs[0][0],
+            "median": median_us,
+            "max": runs[-1][0],
+        },
+        "slowest_imports": [
+            {"module": name, "cumulative_us": cumulative_us}
+            for name, cumulative_us in direct_imports[: args.top]
+        ],
+    }
+
+
+def percentiles(values):
+    """Returns dict of summary statistics for a list of millisecond values"""
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pct(p):
+        return round(values[min(int(len(values) * p), len(values) - 1)], 3)
+
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": pct(0.50),
+        "p95": pct(0.95),
+        "max": round(values[-1], 3),
+    }
+
+
+class PhaseTimer:
+    """Wraps functions to record how long calls take per phase
+
+    :attribute timings: dict of phase -> list of milliseconds
+
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.lock = threading.Lock()
+
+    def record(self, phase, ms):
+        with self.lock:
+            self.timings.setdefault(phase, []).append(ms)
+
+    def wrap(self, phase, func):
+        @functools.wraps(func)
+        def _timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(phase, (time.perf_counter() - start) * 1000)
+
+        return _timed
+
+
+class FakeCollectorHandler(http.server.BaseHTTPRequestHandler):
+    """Collector that reads the payload and returns a crash id"""
+
+    protocol_version = "HTTP/1.1"
+    # Otherwise Nagle's algorithm and delayed ACKs add 40ms to every response
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        remaining = int(self.headers["Content-Length"])
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(remaining, MB)))
+
+        body = b"CrashID=bp-xxx"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_collector():
+    """Starts a collector in a background thread and returns its submit url"""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeCollectorHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return "http://127.0.0.1:%d/submit" % server.server_port
+
+
+class BenchmarkContext:
+    """Minimal AWS Lambda context"""
+
+    def get_remaining_time_in_millis(self):
+        return 900_000
+
+
+def build_crash(crash_id, dump_size, payload_compressed, annotations=100):
+    """Returns (raw crash, dumps) with annotations and one dump
+
+    Half the dump is random and half is zeros so it's somewhat compressible.
+
+    """
+    raw_crash = {"Annotation%d" % i: "value %d" % i for i in range(annotations)}
+    raw_crash.update(
+        {
+            "uuid": crash_id,
+            "ProductName": "Firefox",
+            "Version": "120.0",
+            "metadata": {
+                "payload": "multipart",
+                "payload_compressed": payload_compressed,
+                "user_agent": "benchmark/1.0",
+            },
+            "version": 2,
+        }
+    )
+    half = dump_size // 2
+    dump = os.urandom(half) + bytes(dump_size - half)
+    return raw_crash, {"upload_file_minidump": dump}
+
+
+def run_handler_scenario(args):
+    """Runs a single handler scenario in this process and returns results
+
+    This should run in a new process so import time and peak RSS are for this
+    scenario only.
+
+    """
+    from moto import mock_s3
+
+    collector_url = start_fake_collector()
+    os.environ["SUBMITTER_DESTINATIONS"] = "%s|100" % collector_url
+    for item in args.env:
+        key, val = item.split("=", 1)
+        os.environ[key] = val
+
+    start = time.perf_counter()
+    submitter = import_submitter()
+    import_ms = (time.perf_counter() - start) * 1000
+
+    # Send logs nowhere so they don't skew the timings
+    submitter.ensure_logging_set_up()
+    logging.getLogger(submitter.LOGGER_NAME).setLevel(logging.WARNING)
+
+    timer = PhaseTimer()
+    submitter.fetch_crash = timer.wrap("s3_fetch", submitter.fetch_crash)
+    submitter.multipart_encode = timer.wrap("encode", submitter.multipart_encode)
+    submitter.gzip_parts = timer.wrap("compress", submitter.gzip_parts)
+
+    import requests
+
+    requests.Session.post = timer.wrap("post", requests.Session.post)
+
+    dump_size = int(args.crash_size * MB)
+    invocation_ms = []
+    with mock_s3():
+        client = submitter.build_s3_client("foo", "foo")
+        bucket = submitter.CONFIG.s3_bucket
+        client.create_bucket(Bucket=bucket)
+
+        # Every invocation gets new crash ids so nothing is skipped as a
+        # duplicate
+        events = []
+        for invocation in range(args.iterations):
+            keys = []
+            for i in range(args.records):
+                crash_id = "de1bb258-cbbf-4589-a673-%06x%06d" % (
+                    invocation * args.records + i,
+                    231017,
+                )
+                raw_crash, dumps = build_crash(
+                    crash_id, dump_size, args.payload_compressed
+                )
+                key = submitter.generate_s3_key("raw_crash", crash_id)
+                client.put_object(
+                    Bucket=bucket, Key=key, Body=json.dumps(raw_crash).encode()
+                )
+                client.put_object(
+                    Bucket=bucket,
+                    Key=submitter.generate_s3_key("dump_names", crash_id),
+                    Body=json.dumps(list(dumps)).encode(),
+                )
+                for name, data in dumps.items():
+                    client.put_object(
+                        Bucket=bucket,
+                        Key=submitter.generate_s3_key(name, crash_id),
+                        Body=data,
+                    )
+                keys.append(key)
+
+            events.append(
+                {
+                    "Records": [
+                        {
+                            "eventSource": "aws:s3",
+                            "eventName": "ObjectCreated:Put",
+                            "s3": {
+                                "object": {"key": key},
+                                "bucket": {"name": bucket},
+                            },
+                        }
+                        for key in keys
+                    ]
+                }
+            )
+
+        for event in events:
+            start = time.perf_counter()
+            submitter.handler(event, BenchmarkContext())
+            invocation_ms.append((time.perf_counter() - start) * 1000)
+
+    phases = timer.timings
+
+    return {
+        "crash_size_bytes": dump_size,
+        "records": args.records,
+        "payload_compressed": args.payload_compressed,
+        "env": args.env,
+        "import_ms": round(import_ms, 3),
+        "cold_invocation_ms": round(invocation_ms[0], 3),
+        "warm_invocation_ms": percentiles(invocation_ms[1:]),
+        "phase_ms": {phase: percentiles(values) for phase, values in phases.items()},
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def cmd_encode(args):
+    """Compares encoding a crash payload for different numbers of annotations"""
+    from email.header import Header
+
+    submitter = import_submitter()
+    smart_bytes = submitter.smart_bytes
+
+    def bytesio_encode(raw_crash, dumps, payload_type, payload_compressed):
+        # What multipart_encode did originally, without compression
+        boundary = "01659896d5dc42cabd7f3d8a3dcdd3bb"
+        output = io.BytesIO()
+
+        if payload_type == "json":
+            output.write(smart_bytes("--%s\r\n" % boundary))
+            output.write(b'Content-Disposition: form-data; name="extra"\r\n')
+            output.write(b"Content-Type: application/json\r\n")
+            output.write(b"\r\n")
+            extra_data = json.dumps(raw_crash, sort_keys=True, separators=(",", ":"))
+            output.write(smart_bytes(extra_data))
+            output.write(b"\r\n")
+
+        else:
+            for key, val in sorted(raw_crash.items()):
+                output.write(smart_bytes("--%s\r\n" % boundary))
+                output.write(
+                    smart_bytes(
+                        'Content-Disposition: form-data; name="%s"\r\n'
+                        % Header(key).encode()
+                    )
+                )
+                output.write(b"Content-Type: text/plain; charset=utf-8\r\n")
+                output.write(b"\r\n")
+                output.write(smart_bytes(val))
+                output.write(b"\r\n")
+
+        for name, data in sorted(dumps.items()):
+            output.write(smart_bytes("--%s\r\n" % boundary))
+            output.write(
+                smart_bytes(
+                    'Content-Disposition: form-data; name="%s"; filename="file.dump"\r\n'
+                    % Header(name).encode()
+                )
+            )
+            output.write(b"Content-Type: application/octet-stream\r\n")
+            output.write(b"\r\n")
+            output.write(data)
+            output.write(b"\r\n")
+
+        output.write(("--%s--\r\n" % boundary).encode("utf-8"))
+        output = output.getvalue()
+
+        headers = {
+            "Content-Type": "multipart/form-data; boundary=%s" % boundary,
+            "Content-Length": str(len(output)),
+        }
+        return output, headers
+
+    strategies = {
+        "bytesio": bytesio_encode,
+        "multipart_encode": submitter.multipart_encode,
+    }
+
+    results = []
+    for annotations in args.annotations:
+        raw_crash, dumps = build_crash(
+            "de1bb258-cbbf-4589-a673-34f800231017",
+            1024,
+            "0",
+            annotations=annotations,
+        )
+        raw_crash = submitter.remove_collector_keys(raw_crash)
+
+        for payload_type in ("multipart", "json"):
+            for name, encode in strategies.items():
+                result = measure(
+                    functools.partial(
+                        encode,
+                        raw_crash=raw_crash,
+                        dumps=dumps,
+                        payload_type=payload_type,
+                        payload_compressed="0",
+                    ),
+                    args.iterations,
+                )
+                result.update(
+                    {
+                        "strategy": name,
+                        "annotations": annotations,
+                        "payload_type": payload_type,
+                    }
+                )
+                results.append(result)
+
+    # Don't let metrics pile up
+    submitter.METRICS.flush()
+
+    return {
+        "benchmark": "encode",
+        "python": platform.python_version(),
+        "results": results,
+    }
+
+
+def cmd_handler_scenario(args):
+    return run_handler_scenario(args)
+
+
+def cmd_handler(args):
+    """Runs handler scenarios for combinations of crash sizes and record counts"""
+    results = []
+    for crash_size in args.crash_sizes:
+        for records in args.records:
+            for payload_compressed in args.payload_compressed:
+                cmd = [
+                    sys.executable,
+                    os.path.abspath(__file__),
+                    "handler-scenario",
+                    "--crash-size=%s" % crash_size,
+                    "--records=%s" % records,
+                    "--payload-compressed=%s" % payload_compressed,
+                    "--iterations=%s" % args.iterations,
+                ]
+                cmd.extend("--env=%s" % item for item in args.env)
+                proc = subprocess.run(cmd, capture_output=True, text=True)
+                if proc.returncode != 0:
+                    print(proc.stderr, file=sys.stderr)
+                    proc.check_returncode()
+                results.append(json.loads(proc.stdout))
+
+    return {
+        "benchmark": "handler",
+        "python": platform.python_version(),
+        "results": results,
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Runs submitter benchmarks.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    s3fetch_parser = subparsers.add_parser(
+        "s3fetch", help="compare memory used fetching objects from S3"
+    )
+    s3fetch_parser.add_argument(
+        "--sizes",
+        type=float,
+        nargs="+",
+        default=[1, 10, 50],
+        help="object sizes in MB",
+    )
+    s3fetch_parser.add_argument("--iterations", type=int, default=5)
+    s3fetch_parser.set_defaults(func=cmd_s3fetch)
+
+    importtime_parser = subparsers.add_parser(
+        "importtime", help="measure submitter import time (cold start cost)"
+    )
+    importtime_parser.add_argument("--iterations", type=int, default=10)
+    importtime_parser.add_argument(
+        "--top", type=int, default=10, help="number of slowest imports to list"
+    )
+    importtime_parser.set_defaults(func=cmd_importtime)
+
+    encode_parser = subparsers.add_parser(
+        "encode",
+        help="compare encoding crash payloads with different numbers of annotations",
+    )
+    encode_parser.add_argument(
+        "--annotations",
+        type=int,
+        nargs="+",
+        default=[50, 150, 500],
+        help="numbers of annotations",
+    )
+    encode_parser.add_argument("--iterations", type=int, default=500)
+    encode_parser.set_defaults(func=cmd_encode)
+
+    handler_parser = subparsers.add_parser(
+        "handler",
+        help=(
+            "measure handler latency per invocation and per phase and peak RSS "
+            "for combinations of crash sizes and record counts"
+        ),
+    )
+    handler_parser.add_argument(
+        "--crash-sizes",
+        type=float,
+        nargs="+",
+        default=[0.1, 1, 5],
+        help="dump sizes in MB",
+    )
+    handler_parser.add_argument(
+        "--records",
+        type=int,
+        nargs="+",
+        default=[1, 10],
+        help="number of records per event",
+    )
+    handler_parser.add_argument(
+        "--payload-compressed", nargs="+", choices=["0", "1"], default=["0", "1"]
+    )
+    handler_parser.add_argument(
+        "--iterations", type=int, default=5, help="number of invocations"
+    )
+    handler_parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        help="KEY=VALUE environment variable to set for submitter",
+    )
+    handler_parser.set_defaults(func=cmd_handler)
+
+    # Runs a single scenario; cmd_handler runs this in a new process
+    scenario_parser = subparsers.add_parser("handler-scenario")
+    scenario_parser.add_argument("--crash-size", type=float, required=True)
+    scenario_parser.add_argument("--records", type=int, required=True)
+    scenario_parser.add_argument("--payload-compressed", choices=["0", "1"])
+    scenario_parser.add_argument("--iterations", type=int, required=True)
+    scenario_parser.add_argument("--env", action="append", default=[])
+    scenario_parser.set_defaults(func=cmd_handler_scenario)
+
+    args = parser.parse_args(argv)
+    print(json.dumps(args.func(args), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
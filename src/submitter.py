@@ -4,33 +4,69 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import contextlib
-from email.header import Header
-import gzip
-import io
+import functools
 import json
 import logging
-import logging.config
 import os
 import random
 import re
+import sys
+import threading
 import time
+import urllib.parse
+import zlib
 
-import boto3
-from botocore.client import Config as Boto3Config
-import dockerflow  # noqa
-from google.cloud.logging_v2.client import Client as CloudLoggingClient
-from google.cloud.logging_v2.handlers import CloudLoggingHandler
-from google.cloud.logging_v2.handlers.transports.sync import SyncTransport
-from google.oauth2.service_account import Credentials
-import requests
+# NOTE: boto3, concurrent.futures, dockerflow, email.header,
+# google-cloud-logging, requests, and logging.config are slow to import, so
+# they're imported where they're used to reduce Lambda cold start time.
 
 
 NOVALUE = object()
 
 
-Destination = namedtuple("Destination", ["url", "throttle"])
+# payload_type and payload_compressed are None when crashes should be posted
+# the way they were originally submitted
+Destination = namedtuple(
+    "Destination",
+    [
+        "url",
+        "throttle",
+        "connect_timeout",
+        "timeout",
+        "payload_type",
+        "payload_compressed",
+        "rate",
+        "byte_rate",
+        "rate_limit_policy",
+    ],
+    defaults=(None, None, 0.0, 0.0, "delay"),
+)
+
+
+def one_of(*choices):
+    """Returns a function that validates a value is one of choices"""
+
+    def _one_of(value):
+        if value not in choices:
+            raise ValueError("%r is not one of %r" % (value, choices))
+        return value
+
+    return _one_of
+
+
+# Options that can be specified for a destination in SUBMITTER_DESTINATIONS
+# as "name=value" -> function to convert the value
+DESTINATION_OPTIONS = {
+    "connect_timeout": float,
+    "timeout": float,
+    "payload_type": one_of("multipart", "json"),
+    "payload_compressed": one_of("0", "1"),
+    "rate": float,
+    "byte_rate": float,
+    "rate_limit_policy": one_of("delay", "shed"),
+}
 
 
 DEFAULT_USER_AGENT = "socorro-submitter/1.0"
@@ -45,14 +81,125 @@ class Config:
         self.s3_bucket = self.get_from_env("S3_BUCKET")
         self.s3_region_name = self.get_from_env("S3_REGION_NAME")
 
+        # How to decide whether a crash is throttled: "random" rolls a die for
+        # every crash; "hash" uses a hash of the crash id so a crash is
+        # throttled the same way every time
+        self.throttle_mode = self.get_from_env("THROTTLE_MODE", "random")
+
+        # Number of crashes to fetch, encode, and post in parallel
+        self.concurrency = int(self.get_from_env("CONCURRENCY", "1"))
+
+        # Number of dumps for a single crash to fetch from S3 in parallel
+        self.dump_fetch_concurrency = int(
+            self.get_from_env("DUMP_FETCH_CONCURRENCY", "4")
+        )
+
+        # Maximum total bytes of raw crash and dumps to fetch for a single crash;
+        # 0 means no limit
+        self.max_crash_size = int(self.get_from_env("MAX_CRASH_SIZE", "0"))
+
+        # Whether to stream dumps from S3 into the HTTP POST payload rather than
+        # downloading them first
+        self.stream_dumps = self.get_from_env("STREAM_DUMPS", "0") == "1"
+
+        # Seconds before the Lambda invocation times out to stop starting new
+        # crashes so there's time to finish the ones in progress, emit metrics,
+        # and send logs
+        self.deadline_margin = float(self.get_from_env("DEADLINE_MARGIN", "2"))
+
+        # Whether the handler returns the crashes that failed as a partial batch
+        # failure response rather than raising an error when any crash fails
+        self.partial_batch_failures = (
+            self.get_from_env("PARTIAL_BATCH_FAILURES", "0") == "1"
+        )
+
+        # Maximum number of connections to keep open to each destination
+        self.http_pool_size = int(self.get_from_env("HTTP_POOL_SIZE", "10"))
+
+        # Seconds to wait to connect to a destination and for a destination to
+        # respond to an HTTP POST; these can be overridden for a destination in
+        # destinations
+        self.http_connect_timeout = float(
+            self.get_from_env("HTTP_CONNECT_TIMEOUT", "5")
+        )
+        self.http_timeout = float(self.get_from_env("HTTP_TIMEOUT", "30"))
+
+        # Number of times to retry an HTTP POST that fails with a connection
+        # error or a 5xx response and the base delay in seconds between retries
+        self.http_retries = int(self.get_from_env("HTTP_RETRIES", "2"))
+        self.http_retry_backoff = float(self.get_from_env("HTTP_RETRY_BACKOFF", "0.5"))
+
+        # Maximum number of (crash id, destination) pairs to remember as
+        # submitted and seconds to remember them for; pairs that were submitted
+        # aren't submitted again; 0 means don't remember any
+        self.dedup_cache_size = int(self.get_from_env("DEDUP_CACHE_SIZE", "10000"))
+        self.dedup_cache_ttl = float(self.get_from_env("DEDUP_CACHE_TTL", "3600"))
+
+        # What to do with a crash when posting it to a destination would go
+        # over the destination's rate limit: "delay" waits until it can be
+        # posted; "shed" drops it for that destination
+        self.rate_limit_policy = self.get_from_env("RATE_LIMIT_POLICY", "delay")
+
+        # Maximum seconds to delay a crash for rate limiting; crashes that would
+        # need to wait longer fail so they're retried later
+        self.rate_limit_max_delay = float(
+            self.get_from_env("RATE_LIMIT_MAX_DELAY", "10")
+        )
+
+        # Stop posting to a destination for circuit_breaker_cooldown seconds
+        # after this many posts to it fail within circuit_breaker_window
+        # seconds; 0 means never stop
+        self.circuit_breaker_threshold = int(
+            self.get_from_env("CIRCUIT_BREAKER_THRESHOLD", "5")
+        )
+        self.circuit_breaker_window = float(
+            self.get_from_env("CIRCUIT_BREAKER_WINDOW", "60")
+        )
+        self.circuit_breaker_cooldown = float(
+            self.get_from_env("CIRCUIT_BREAKER_COOLDOWN", "30")
+        )
+
+        # gzip compression level (1-9) for crashes with compressed payloads
+        self.compression_level = int(self.get_from_env("COMPRESSION_LEVEL", "6"))
+
+        # Seconds between metrics flushes during long runs; metrics are always
+        # flushed at the end of an invocation; 0 means only flush then
+        self.metrics_flush_interval = float(
+            self.get_from_env("METRICS_FLUSH_INTERVAL", "60")
+        )
+
+        # Whether to log a line for every crash with milliseconds and bytes for
+        # each processing phase
+        self.log_crash_timings = self.get_from_env("LOG_CRASH_TIMINGS", "0") == "1"
+
         # For GCP stackdriver logging
         self.gcp_credentials = self.get_from_env("GCP_CREDENTIALS", "")
+        # "background" sends log records in batches from a background thread;
+        # "sync" sends each log record as it's logged
+        self.gcp_logging_transport = self.get_from_env(
+            "GCP_LOGGING_TRANSPORT", "background"
+        )
+        # Maximum number of log records waiting to be sent by the background
+        # transport; records logged when it's full are dropped
+        self.gcp_logging_max_queue_size = int(
+            self.get_from_env("GCP_LOGGING_MAX_QUEUE_SIZE", "1000")
+        )
+        # Maximum number of log records the background transport sends at once
+        self.gcp_logging_batch_size = int(
+            self.get_from_env("GCP_LOGGING_BATCH_SIZE", "50")
+        )
 
         # These are only used for local development
         self.s3_access_key = self.get_from_env("S3_ACCESS_KEY", "")
         self.s3_secret_access_key = self.get_from_env("S3_SECRET_ACCESS_KEY", "")
         self.s3_endpoint_url = self.get_from_env("S3_ENDPOINT_URL", "")
 
+        # Maximum number of connections in the S3 client connection pool; 0
+        # means enough for the configured fetch concurrency
+        self.s3_max_pool_connections = int(
+            self.get_from_env("S3_MAX_POOL_CONNECTIONS", "0")
+        )
+
     def get_from_env(self, key, default=NOVALUE):
         if default is NOVALUE:
             return os.environ["SUBMITTER_%s" % key]
@@ -79,15 +226,45 @@ class Config:
             setattr(self, key, val)
 
     def get_destinations(self):
-        """Returns a list of Destination instances based on configuration"""
+        """Returns a list of Destination instances based on configuration
+
+        Destinations are separated by commas. Each destination is a url and a
+        throttle separated by ``|`` optionally followed by ``|name=value``
+        options. For example::
+
+            https://example.com|20|timeout=5
+
+        :raises ValueError: if a destination has an unknown option
+
+        """
         destinations = []
         if self.destinations:
             for destination in self.destinations.split(","):
-                url, throttle = destination.split("|")
-                destinations.append(Destination(url=url, throttle=int(throttle)))
+                url, throttle, *options = destination.split("|")
+                kwargs = {
+                    "connect_timeout": self.http_connect_timeout,
+                    "timeout": self.http_timeout,
+                    "rate_limit_policy": self.rate_limit_policy,
+                }
+                for option in options:
+                    name, value = option.split("=", 1)
+                    if name not in DESTINATION_OPTIONS:
+                        raise ValueError(
+                            "unknown destination option %r in %r" % (name, destination)
+                        )
+                    kwargs[name] = DESTINATION_OPTIONS[name](value)
+                destinations.append(
+                    Destination(url=url, throttle=int(throttle), **kwargs)
+                )
         else:
             destinations = [
-                Destination(url=self.destination_url, throttle=self.throttle)
+                Destination(
+                    url=self.destination_url,
+                    throttle=self.throttle,
+                    connect_timeout=self.http_connect_timeout,
+                    timeout=self.http_timeout,
+                    rate_limit_policy=self.rate_limit_policy,
+                )
             ]
         return destinations
 
@@ -97,7 +274,119 @@ CONFIG = Config()
 LOGGER_NAME = "submitter"
 
 
+# List of BoundedLogTransport instances that have been created
+_LOG_TRANSPORTS = []
+
+
+class _CountingLogClient:
+    """Wraps a Cloud Logging client and reports how many entries batches commit
+
+    :arg client: the Cloud Logging client
+    :arg on_commit: function called with the number of entries in every batch
+        that's committed whether or not committing succeeded
+
+    """
+
+    def __init__(self, client, on_commit):
+        self.client = client
+        self.on_commit = on_commit
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def logger(self, name, **kwargs):
+        return _CountingLogger(self.client.logger(name, **kwargs), self.on_commit)
+
+
+class _CountingLogger:
+    def __init__(self, logger, on_commit):
+        self.logger = logger
+        self.on_commit = on_commit
+
+    def __getattr__(self, name):
+        return getattr(self.logger, name)
+
+    def batch(self, **kwargs):
+        return _CountingBatch(self.logger.batch(**kwargs), self.on_commit)
+
+
+class _CountingBatch:
+    def __init__(self, batch, on_commit):
+        self.batch = batch
+        self.on_commit = on_commit
+
+    def __getattr__(self, name):
+        return getattr(self.batch, name)
+
+    def commit(self, **kwargs):
+        # Committing clears the entries, so count them first
+        count = len(self.batch.entries)
+        try:
+            return self.batch.commit(**kwargs)
+        finally:
+            self.on_commit(count)
+
+
+class BoundedLogTransport:
+    """Cloud Logging transport that sends log records in a background thread
+
+    This wraps ``BackgroundThreadTransport`` which batches log records and sends
+    them from a background thread. It bounds the number of log records waiting
+    to be sent--log records sent when it's full are dropped and counted.
+
+    :arg client: the Cloud Logging client
+    :arg name: the log name
+    :arg max_queue_size: maximum number of log records waiting to be sent
+    :arg kwargs: passed to ``BackgroundThreadTransport``
+
+    """
+
+    def __init__(self, client, name, max_queue_size=1000, **kwargs):
+        from google.cloud.logging_v2.handlers.transports.background_thread import (
+            BackgroundThreadTransport,
+        )
+
+        self.max_queue_size = max_queue_size
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.dropped = 0
+        # The worker takes records off its queue and commits them in batches,
+        # so count records as sent when their batch is committed
+        self.transport = BackgroundThreadTransport(
+            _CountingLogClient(client, self.record_sent), name, **kwargs
+        )
+        _LOG_TRANSPORTS.append(self)
+
+    def record_sent(self, count):
+        with self.lock:
+            self.queued -= count
+
+    def pending(self):
+        """Returns the number of log records waiting to be sent"""
+        return self.queued
+
+    def send(self, record, message, **kwargs):
+        with self.lock:
+            if self.pending() >= self.max_queue_size:
+                self.dropped += 1
+                return
+            self.queued += 1
+        self.transport.send(record, message, **kwargs)
+
+    def flush(self):
+        """Blocks until all queued log records are sent"""
+        self.transport.flush()
+
+    def pop_dropped(self):
+        """Returns the number of log records dropped since the last call"""
+        with self.lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
 def setup_logging(config):
+    import logging.config
+
     logging_config = {
         "version": 1,
         # NOTE(willkg): We don't disable existing loggers because that prevents
@@ -125,42 +414,231 @@ def setup_logging(config):
     # If a GCP project id is set, then create a logging handler for it and set
     # it up
     if config.gcp_credentials:
+        from google.cloud.logging_v2.client import Client as CloudLoggingClient
+        from google.cloud.logging_v2.handlers import CloudLoggingHandler
+        from google.cloud.logging_v2.handlers.transports.sync import SyncTransport
+        from google.oauth2.service_account import Credentials
+
         acct_info = json.loads(config.gcp_credentials)
         credentials = Credentials.from_service_account_info(acct_info)
         client = CloudLoggingClient(
             project=acct_info["project_id"], credentials=credentials
         )
 
+        if config.gcp_logging_transport == "sync":
+            transport = SyncTransport
+        else:
+            transport = functools.partial(
+                BoundedLogTransport,
+                max_queue_size=config.gcp_logging_max_queue_size,
+                batch_size=config.gcp_logging_batch_size,
+            )
+
         handler = CloudLoggingHandler(
-            client=client, name="socorro-stage-submitter", transport=SyncTransport
+            client=client, name="socorro-stage-submitter", transport=transport
         )
         handler.setLevel(logging.DEBUG)
         logging.getLogger().addHandler(handler)
         logging.getLogger(LOGGER_NAME).addHandler(handler)
 
 
-setup_logging(CONFIG)
+_LOGGING_LOCK = threading.Lock()
+_LOGGING_SET_UP = False
+
+
+def ensure_logging_set_up():
+    """Sets up logging with CONFIG the first time this is called
+
+    This is deferred until the first invocation rather than done at import so
+    it doesn't add to Lambda cold start time.
+
+    """
+    global _LOGGING_SET_UP
+
+    with _LOGGING_LOCK:
+        if not _LOGGING_SET_UP:
+            setup_logging(CONFIG)
+            _LOGGING_SET_UP = True
+
+
 LOGGER = logging.getLogger(LOGGER_NAME)
 
 
-def statsd_incr(key, value=1, tags=None):
-    """Sends a specially formatted line for datadog to pick up for statsd incr"""
+def statsd_emit(metric_type, key, value, tags=None):
+    """Sends a specially formatted line for datadog to pick up as a metric
+
+    :arg metric_type: the datadog metric type: "count" or "gauge"
+    :arg key: the metric key
+    :arg value: the metric value
+    :arg tags: tuple of "name:value" tags or None; the env tag is added to these
+
+    """
+    all_tags = []
     if CONFIG.env_name:
-        tags = "#env:%s" % CONFIG.env_name
-    else:
-        tags = ""
+        all_tags.append("env:%s" % CONFIG.env_name)
+    if tags:
+        all_tags.extend(tags)
+    tags = ("#" + ",".join(all_tags)) if all_tags else ""
 
     # We pass the data in the message and in extra because mozlog will add
     # extra fields to its JSON msg
-    msg = "MONITORING|%(timestamp)s|%(value)s|count|%(key)s|%(tags)s" % {
+    msg = "MONITORING|%(timestamp)s|%(value)s|%(type)s|%(key)s|%(tags)s" % {
         "timestamp": int(time.time()),
         "key": key,
         "value": value,
+        "type": metric_type,
         "tags": tags,
     }
     LOGGER.info(msg, extra={"key": key, "value": value, "tags": tags})
 
 
+class MetricsAggregator:
+    """Accumulates metrics in memory and emits them in batches
+
+    Counters are summed and histogram values are summarized for each key. When
+    flushed, this emits one line per counter and, for each histogram, these
+    lines:
+
+    * ``<key>.count``: count of values
+    * ``<key>.sum``: count of the sum of the values
+    * ``<key>.max``: gauge of the maximum value
+
+    Counts from concurrent Lambda containers add up, so the mean across all of
+    them is ``<key>.sum`` divided by ``<key>.count``. Gauges from different
+    containers overwrite each other, so there's no mean gauge.
+
+    This is flushed at the end of every invocation. If
+    ``CONFIG.metrics_flush_interval`` is greater than 0, it's also flushed when
+    a metric is recorded that many seconds after the last flush.
+
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.last_flush = time.monotonic()
+
+    def incr(self, key, value=1, tags=None):
+        with self.lock:
+            self.counters[(key, tags)] = self.counters.get((key, tags), 0) + value
+        self.maybe_flush()
+
+    def histogram(self, key, value, tags=None):
+        with self.lock:
+            summary = self.histograms.get((key, tags))
+            if summary is None:
+                self.histograms[(key, tags)] = [1, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                summary[2] = max(summary[2], value)
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        interval = CONFIG.metrics_flush_interval
+        if interval > 0 and time.monotonic() - self.last_flush >= interval:
+            self.flush()
+
+    def flush(self):
+        """Emits all accumulated metrics and resets"""
+        with self.lock:
+            counters, self.counters = self.counters, {}
+            histograms, self.histograms = self.histograms, {}
+            self.last_flush = time.monotonic()
+
+        for (key, tags), value in counters.items():
+            statsd_emit("count", key, value, tags=tags)
+
+        for (key, tags), (count, total, max_value) in histograms.items():
+            statsd_emit("count", "%s.count" % key, count, tags=tags)
+            statsd_emit("count", "%s.sum" % key, round(total, 3), tags=tags)
+            statsd_emit("gauge", "%s.max" % key, max_value, tags=tags)
+
+
+METRICS = MetricsAggregator()
+
+
+def flush_metrics_and_logs():
+    """Emits accumulated metrics and sends pending log records
+
+    This blocks until log records queued for background transports are sent,
+    so nothing is left pending when the Lambda invocation returns.
+
+    """
+    for transport in _LOG_TRANSPORTS:
+        dropped = transport.pop_dropped()
+        if dropped:
+            statsd_incr("socorro.submitter.log_records_dropped", value=dropped)
+
+    METRICS.flush()
+
+    # CloudLoggingHandler.flush() doesn't flush its transport, so flush them
+    # here
+    for transport in _LOG_TRANSPORTS:
+        transport.flush()
+
+    handlers = set(logging.getLogger().handlers) | set(LOGGER.handlers)
+    for handler in handlers:
+        handler.flush()
+
+
+def statsd_incr(key, value=1, tags=None):
+    """Increments a counter that gets sent to datadog when metrics are flushed"""
+    METRICS.incr(key, value=value, tags=tags)
+
+
+def statsd_histogram(key, value, tags=None):
+    """Records a value that gets summarized and sent to datadog when metrics are
+    flushed"""
+    METRICS.histogram(key, value, tags=tags)
+
+
+class PhaseTimings:
+    """Thread-safe record of milliseconds and bytes per phase for a single crash
+
+    :attribute phases: dict of phase name -> {"ms": float, "bytes": int}
+
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.lock = threading.Lock()
+
+    def add(self, phase, ms, size=None):
+        """Records how long a phase took and optionally how many bytes it handled"""
+        with self.lock:
+            self.phases[phase] = {"ms": round(ms, 3)}
+            if size is not None:
+                self.phases[phase]["bytes"] = size
+
+    def set_size(self, phase, size):
+        with self.lock:
+            self.phases.setdefault(phase, {})["bytes"] = size
+
+    @contextlib.contextmanager
+    def timed(self, phase):
+        """Context manager that records how long the block takes as a phase"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, (time.perf_counter() - start_time) * 1000)
+
+
+def get_destination_name(url):
+    """Returns the host and port of a destination url for metrics and logging"""
+    return urllib.parse.urlsplit(url).netloc or url
+
+
+def get_payload_tags(payload_type, payload_compressed):
+    """Returns the metrics tags for a crash's payload type"""
+    return (
+        "payload_type:%s" % payload_type,
+        "payload_compressed:%s" % payload_compressed,
+    )
+
+
 CRASH_ID_RE = re.compile(
     r"""
     ^
@@ -214,16 +692,59 @@ def extract_crash_id_from_record(record):
         return None
 
 
-def build_s3_client(access_key, secret_access_key, region_name=None, endpoint_url=None):
+def map_concurrently(func, items, max_workers):
+    """Calls func on each item using up to max_workers threads
+
+    If max_workers is 1 or less, this calls func on the items serially in the
+    current thread.
+
+    Otherwise, every item is processed even if calling func on an earlier one
+    raised an exception. After all items are processed, the first exception
+    (in item order) is re-raised.
+
+    :arg func: callable that takes a single item
+    :arg items: list of items
+    :arg max_workers: maximum number of threads to use
+
+    :returns: list of results in item order
+
+    """
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    import concurrent.futures
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(max_workers, len(items))
+    ) as executor:
+        futures = [executor.submit(func, item) for item in items]
+
+    return [future.result() for future in futures]
+
+
+def build_s3_client(
+    access_key,
+    secret_access_key,
+    region_name=None,
+    endpoint_url=None,
+    max_pool_connections=None,
+):
+    import boto3
+    from botocore.client import Config as Boto3Config
+
     session_kwargs = {}
     if access_key and secret_access_key:
         session_kwargs["aws_access_key_id"] = access_key
         session_kwargs["aws_secret_access_key"] = secret_access_key
     session = boto3.session.Session(**session_kwargs)
 
+    config_kwargs = {"s3": {"addressing_style": "path"}}
+    if max_pool_connections:
+        config_kwargs["max_pool_connections"] = max_pool_connections
+
     kwargs = {
         "service_name": "s3",
-        "config": Boto3Config(s3={"addressing_style": "path"}),
+        "config": Boto3Config(**config_kwargs),
     }
     if region_name:
         kwargs["region_name"] = region_name
@@ -234,19 +755,213 @@ def build_s3_client(access_key, secret_access_key, region_name=None, endpoint_ur
     return session.client(**kwargs)
 
 
-def s3_fetch(client, bucket, key):
+# Map of S3 client configuration tuple -> S3 client; this persists across warm
+# Lambda invocations
+_S3_CLIENTS = {}
+_S3_CLIENTS_LOCK = threading.Lock()
+
+
+def get_s3_max_pool_connections():
+    """Returns the S3 connection pool size to use based on configuration"""
+    if CONFIG.s3_max_pool_connections:
+        return CONFIG.s3_max_pool_connections
+
+    # Enough for every crash being processed to fetch its raw crash and dumps
+    # at the same time
+    in_flight = max(CONFIG.concurrency, 1) * (max(CONFIG.dump_fetch_concurrency, 1) + 1)
+    return max(in_flight, 10)
+
+
+def get_s3_client():
+    """Returns an S3 client built from configuration
+
+    The client and its connection pool are created once and reused across warm
+    Lambda invocations. Clients are cached by access key, region, endpoint, and
+    pool size, so changing the configuration gets a new client.
+
+    :returns: S3 client
+
+    """
+    key = (
+        CONFIG.s3_access_key,
+        CONFIG.s3_secret_access_key,
+        CONFIG.s3_region_name,
+        CONFIG.s3_endpoint_url,
+        get_s3_max_pool_connections(),
+    )
+    with _S3_CLIENTS_LOCK:
+        client = _S3_CLIENTS.get(key)
+        if client is None:
+            client = build_s3_client(
+                access_key=key[0],
+                secret_access_key=key[1],
+                region_name=key[2],
+                endpoint_url=key[3],
+                max_pool_connections=key[4],
+            )
+            _S3_CLIENTS[key] = client
+    return client
+
+
+class CrashTooLargeError(Exception):
+    """Raised when crash data exceeds the configured maximum crash size"""
+
+
+class ByteBudget:
+    """Thread-safe running total of bytes fetched for a single crash
+
+    :arg max_bytes: the maximum number of bytes that can be reserved; 0 means
+        no limit
+
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, size):
+        """Reserves size bytes
+
+        :raises CrashTooLargeError: if reserving size bytes puts the total
+            over max_bytes
+
+        """
+        with self.lock:
+            self.total += size
+            if self.max_bytes and self.total > self.max_bytes:
+                raise CrashTooLargeError(
+                    "%d bytes exceeds maximum of %d" % (self.total, self.max_bytes)
+                )
+
+
+# Size of chunks read from S3 when fetching and streaming objects
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def s3_fetch(client, bucket, key, budget=None):
     """Fetches a key from S3
 
+    The object data is read in chunks into a buffer preallocated to the object
+    size, so the data is never copied into an intermediate buffer.
+
+    If a budget is provided, the object size is reserved against it before the
+    object data is read.
+
     :arg client: S3 client
     :arg bucket: S3 bucket name
     :arg key: key for the item to fetch
+    :arg budget: ByteBudget or None
+
+    :returns: item as a bytearray
+
+    :raises CrashTooLargeError: if the object doesn't fit in the budget
+
+    """
+    resp = client.get_object(Bucket=bucket, Key=key)
+    body = resp["Body"]
+    try:
+        size = resp["ContentLength"]
+        if budget is not None:
+            budget.reserve(size)
+
+        data = bytearray(size)
+        pos = 0
+        with memoryview(data) as view:
+            while pos < size:
+                chunk = body.read(min(STREAM_CHUNK_SIZE, size - pos))
+                if not chunk:
+                    break
+                view[pos : pos + len(chunk)] = chunk
+                pos += len(chunk)
+    finally:
+        body.close()
+
+    if pos != size:
+        raise ValueError("%s: expected %d bytes, got %d" % (key, size, pos))
+    return data
+
+
+class StreamFetchError(Exception):
+    """Raised when fetching S3 object data fails while streaming it"""
 
-    :returns: item as bytes
+
+class S3StreamingObject:
+    """Stand-in for S3 object data that streams the data when iterated over
+
+    The length is known from the object metadata without downloading the
+    object. Every iteration issues a new GetObject and yields the data in
+    chunks, so only one chunk is held in memory at a time. Errors fetching the
+    data are raised as StreamFetchError so they can be told apart from errors
+    with wherever the data is being sent.
+
+    :arg client: S3 client
+    :arg bucket: S3 bucket name
+    :arg key: key for the object
+    :arg size: size of the object in bytes
+
+    """
+
+    def __init__(self, client, bucket, key, size):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        try:
+            resp = self.client.get_object(Bucket=self.bucket, Key=self.key)
+        except Exception as exc:
+            raise StreamFetchError("%s: %s" % (self.key, exc)) from exc
+
+        body = resp["Body"]
+        total = 0
+        try:
+            chunks = body.iter_chunks(STREAM_CHUNK_SIZE)
+            while True:
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                except Exception as exc:
+                    raise StreamFetchError("%s: %s" % (self.key, exc)) from exc
+                total += len(chunk)
+                yield chunk
+        finally:
+            body.close()
+
+        if total != self.size:
+            raise StreamFetchError(
+                "%s: expected %d bytes, got %d" % (self.key, self.size, total)
+            )
+
+    def __bytes__(self):
+        return b"".join(self)
+
+
+def s3_stream(client, bucket, key, budget=None):
+    """Returns an S3StreamingObject for a key in S3
+
+    This only fetches the object metadata. The object data is fetched when the
+    S3StreamingObject is iterated over.
+
+    :arg client: S3 client
+    :arg bucket: S3 bucket name
+    :arg key: key for the item to stream
+    :arg budget: ByteBudget or None
+
+    :returns: S3StreamingObject
+
+    :raises CrashTooLargeError: if the object doesn't fit in the budget
 
     """
-    data = io.BytesIO()
-    client.download_fileobj(bucket, key, data)
-    return data.getvalue()
+    resp = client.head_object(Bucket=bucket, Key=key)
+    if budget is not None:
+        budget.reserve(resp["ContentLength"])
+    return S3StreamingObject(client, bucket, key, resp["ContentLength"])
 
 
 def generate_s3_key(kind, crash_id):
@@ -267,27 +982,99 @@ def generate_s3_key(kind, crash_id):
     return "v1/%s/%s" % (kind, crash_id)
 
 
-def fetch_raw_crash(client, bucket, crash_id):
+def fetch_raw_crash(client, bucket, crash_id, budget=None):
     """Fetches raw crash and converts from JSON to Python dict"""
     key = generate_s3_key("raw_crash", crash_id)
-    data = s3_fetch(client, bucket, key).decode("utf-8")
-    return json.loads(data)
+    # json.loads handles utf-8 encoded bytes, so there's no need to decode the
+    # data into a str first
+    return json.loads(s3_fetch(client, bucket, key, budget=budget))
+
 
+def fetch_dumps(client, bucket, crash_id, max_workers=1, budget=None, stream=False):
+    """Fetches dump data and returns dict of name -> data
 
-def fetch_dumps(client, bucket, crash_id):
-    """Fetches dump data and returns list of (name, data) tuples"""
-    dumps = {}
+    :arg client: S3 client
+    :arg bucket: S3 bucket name
+    :arg crash_id: the crash id
+    :arg max_workers: maximum number of dumps to fetch in parallel
+    :arg budget: ByteBudget or None
+    :arg stream: if True, returns S3StreamingObject instances that fetch dump
+        data when iterated over instead of fetching the dump data
+
+    :returns: dict of dump name -> dump data
 
+    """
     # fetch dump_names
     key = generate_s3_key("dump_names", crash_id)
     dump_names = json.loads(s3_fetch(client, bucket, key))
 
     # fetch dumps
-    for name in dump_names:
+    fetch = s3_stream if stream else s3_fetch
+
+    def fetch_dump(name):
         key = generate_s3_key(name, crash_id)
-        dumps[name] = s3_fetch(client, bucket, key)
+        return name, fetch(client, bucket, key, budget=budget)
+
+    return dict(map_concurrently(fetch_dump, dump_names, max_workers=max_workers))
+
 
-    return dumps
+def fetch_crash(client, bucket, crash_id, timings=None):
+    """Fetches raw crash and dumps for a crash
+
+    If ``CONFIG.dump_fetch_concurrency`` is greater than 1, the raw crash is
+    fetched in parallel with the dumps.
+
+    If ``CONFIG.stream_dumps`` is True, dump data isn't fetched here. Instead,
+    the dumps are S3StreamingObject instances that stream the data from S3 when
+    the payload is sent.
+
+    :arg client: S3 client
+    :arg bucket: S3 bucket name
+    :arg crash_id: the crash id
+    :arg timings: PhaseTimings to record "fetch_raw_crash" and "fetch_dumps"
+        phases in or None
+
+    :returns: tuple of (raw crash dict, dumps dict)
+
+    :raises CrashTooLargeError: if the crash is larger than
+        ``CONFIG.max_crash_size``
+
+    """
+    budget = ByteBudget(CONFIG.max_crash_size)
+    max_workers = CONFIG.dump_fetch_concurrency
+    timings = timings if timings is not None else PhaseTimings()
+
+    def _fetch_raw_crash():
+        with timings.timed("fetch_raw_crash"):
+            return fetch_raw_crash(client, bucket, crash_id, budget=budget)
+
+    def _fetch_dumps():
+        with timings.timed("fetch_dumps"):
+            return fetch_dumps(
+                client,
+                bucket,
+                crash_id,
+                max_workers=max_workers,
+                budget=budget,
+                stream=CONFIG.stream_dumps,
+            )
+
+    if max_workers <= 1:
+        raw_crash = _fetch_raw_crash()
+        dumps = _fetch_dumps()
+    else:
+        import concurrent.futures
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            raw_crash_future = executor.submit(_fetch_raw_crash)
+            dumps = _fetch_dumps()
+            raw_crash = raw_crash_future.result()
+
+    # The budget has the sizes of the raw crash and the dumps
+    dumps_size = sum(len(data) for data in dumps.values())
+    timings.set_size("fetch_raw_crash", budget.total - dumps_size)
+    timings.set_size("fetch_dumps", dumps_size)
+    return raw_crash, dumps
 
 
 COLLECTOR_KEYS_TO_REMOVE = [
@@ -323,90 +1110,865 @@ def smart_bytes(thing):
     return repr(thing).encode("utf-8")
 
 
-def multipart_encode(raw_crash, dumps, payload_type, payload_compressed):
-    """Takes a raw_crash and list of (name, dump) and converts to a multipart/form-data
+class MultipartPayload:
+    """HTTP POST payload made up of a list of parts
 
-    This returns a tuple of two things:
+    Parts are referenced rather than copied into a single buffer. The payload
+    can be iterated over more than once (for example, once per destination) and
+    has a length, so it can be passed as the ``data`` argument when posting and
+    will get sent with a ``Content-Length`` rather than chunked.
 
-    1. a ``bytes`` object with the HTTP POST payload
-    2. a dict of headers with ``Content-Type`` and ``Content-Length`` in it
+    :arg parts: list of bytes-like objects or objects with a length that yield
+        bytes chunks when iterated over like S3StreamingObject
 
-    :arg raw_crash: dict of crash annotations
-    :arg dumps: list of (name, dump) tuples
-    :arg payload_type: either "multipart" or "json"
-    :arg payload_compressed: either "1" or "0"
+    """
 
-    :returns: tuple of (bytes, headers dict)
+    def __init__(self, parts):
+        self.parts = parts
+        self.length = sum(len(part) for part in parts)
 
-    """
-    # NOTE(willkg): This is the result of uuid.uuid4().hex. We just need a
-    # unique string to denote the boundary between parts in the payload.
-    boundary = "01659896d5dc42cabd7f3d8a3dcdd3bb"
-    output = io.BytesIO()
+    def __len__(self):
+        return self.length
 
-    # If the payload of the original crash report had the crash annotations in
-    # the "extra" field as a JSON blob, we should do the same here
-    if payload_type == "json":
-        output.write(smart_bytes("--%s\r\n" % boundary))
-        output.write(b'Content-Disposition: form-data; name="extra"\r\n')
-        output.write(b"Content-Type: application/json\r\n")
-        output.write(b"\r\n")
-        extra_data = json.dumps(raw_crash, sort_keys=True, separators=(",", ":"))
-        output.write(smart_bytes(extra_data))
-        output.write(b"\r\n")
+    def __iter__(self):
+        for part in self.parts:
+            if isinstance(part, (bytes, bytearray, memoryview)):
+                yield part
+            else:
+                yield from part
 
-    else:
-        # Package up raw crash metadata--sort them so they're stable in the payload
-        for key, val in sorted(raw_crash.items()):
-            output.write(smart_bytes("--%s\r\n" % boundary))
-            output.write(
-                smart_bytes(
-                    'Content-Disposition: form-data; name="%s"\r\n'
-                    % Header(key).encode()
-                )
+    def __bytes__(self):
+        return b"".join(self)
+
+
+def gzip_parts(parts, level=6):
+    """Compresses an iterable of bytes-like parts with gzip
+
+    Parts are compressed one at a time as they're produced, so the uncompressed
+    data never needs to be in a single buffer.
+
+    :arg parts: iterable of bytes-like objects
+    :arg level: compression level from 1 (fastest) to 9 (smallest)
+
+    :returns: list of compressed bytes chunks
+
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    chunks = []
+    for part in parts:
+        chunk = compressor.compress(part)
+        if chunk:
+            chunks.append(chunk)
+    chunks.append(compressor.flush())
+    return chunks
+
+
+# NOTE(willkg): This is the result of uuid.uuid4().hex. We just need a
+# unique string to denote the boundary between parts in the payload.
+BOUNDARY = "01659896d5dc42cabd7f3d8a3dcdd3bb"
+BOUNDARY_LINE = ("--%s\r\n" % BOUNDARY).encode("utf-8")
+END_BOUNDARY_LINE = ("--%s--\r\n" % BOUNDARY).encode("utf-8")
+
+
+# Crash annotation names are mostly the same across crashes and
+# Header().encode() is slow, so field headers are cached
+@functools.lru_cache(maxsize=2048)
+def encode_field_header(name, content_type, filename=None):
+    """Returns the boundary line and headers for a field in a multipart payload
+
+    :arg name: the field name
+    :arg content_type: the Content-Type of the field value
+    :arg filename: the filename for file fields or None
+
+    :returns: bytes
+
+    """
+    from email.header import Header
+
+    disposition = 'form-data; name="%s"' % Header(name).encode()
+    if filename is not None:
+        disposition += '; filename="%s"' % filename
+    return BOUNDARY_LINE + smart_bytes(
+        "Content-Disposition: %s\r\nContent-Type: %s\r\n\r\n"
+        % (disposition, content_type)
+    )
+
+
+def multipart_encode(raw_crash, dumps, payload_type, payload_compressed, tags=None):
+    """Takes a raw_crash and list of (name, dump) and converts to a multipart/form-data
+
+    This returns a tuple of two things:
+
+    1. a ``MultipartPayload`` with the HTTP POST payload
+    2. a dict of headers with ``Content-Type`` and ``Content-Length`` in it
+
+    The payload references the dump data rather than copying it.
+
+    :arg raw_crash: dict of crash annotations
+    :arg dumps: list of (name, dump) tuples
+    :arg payload_type: either "multipart" or "json"
+    :arg payload_compressed: either "1" or "0"
+    :arg tags: tags for metrics or None for tags for the payload type
+
+    :returns: tuple of (MultipartPayload, headers dict)
+
+    """
+    start_time = time.perf_counter()
+    if tags is None:
+        tags = get_payload_tags(payload_type, payload_compressed)
+
+    # Annotation fields are collected here and joined into a single part
+    fields = []
+
+    # If the payload of the original crash report had the crash annotations in
+    # the "extra" field as a JSON blob, we should do the same here
+    if payload_type == "json":
+        fields.append(encode_field_header("extra", "application/json"))
+        extra_data = json.dumps(raw_crash, sort_keys=True, separators=(",", ":"))
+        fields.append(extra_data.encode("utf-8"))
+        fields.append(b"\r\n")
+
+    else:
+        # Package up raw crash metadata--sort them so they're stable in the payload
+        for key, val in sorted(raw_crash.items()):
+            fields.append(encode_field_header(key, "text/plain; charset=utf-8"))
+            fields.append(
+                val.encode("utf-8") if isinstance(val, str) else smart_bytes(val)
             )
-            output.write(b"Content-Type: text/plain; charset=utf-8\r\n")
-            output.write(b"\r\n")
-            output.write(smart_bytes(val))
-            output.write(b"\r\n")
+            fields.append(b"\r\n")
+
+    parts = [b"".join(fields)]
 
     # Insert dump data--sort them so they're stable in the payload
     for name, data in sorted(dumps.items()):
-        output.write(smart_bytes("--%s\r\n" % boundary))
-
         # dumps are sent as streams
-        output.write(
-            smart_bytes(
-                'Content-Disposition: form-data; name="%s"; filename="file.dump"\r\n'
-                % Header(name).encode()
-            )
-        )
-        output.write(b"Content-Type: application/octet-stream\r\n")
-        output.write(b"\r\n")
-        output.write(data)
-        output.write(b"\r\n")
+        parts.append(encode_field_header(name, "application/octet-stream", "file.dump"))
+        parts.append(data)
+        parts.append(b"\r\n")
 
     # Add end boundary
-    output.write(("--%s--\r\n" % boundary).encode("utf-8"))
-    output = output.getvalue()
+    parts.append(END_BOUNDARY_LINE)
+    payload = MultipartPayload(parts)
 
     # Generate headers
     headers = {
-        "Content-Type": "multipart/form-data; boundary=%s" % boundary,
-        "Content-Length": str(len(output)),
+        "Content-Type": "multipart/form-data; boundary=%s" % BOUNDARY,
+        "Content-Length": str(len(payload)),
     }
 
+    encode_ms = (time.perf_counter() - start_time) * 1000
+    statsd_histogram("socorro.submitter.payload_bytes", len(payload), tags=tags)
+    statsd_histogram("socorro.submitter.encode_ms", round(encode_ms, 3), tags=tags)
+
     # Compress if it we need to
     if payload_compressed == "1":
-        bio = io.BytesIO()
-        g = gzip.GzipFile(fileobj=bio, mode="w")
-        g.write(output)
-        g.close()
-        output = bio.getbuffer()
-        headers["Content-Length"] = str(len(output))
-        headers["Content-Encoding"] = "gzip"
+        payload, headers = compress_payload(payload, headers, tags=tags)
+
+    return payload, headers
+
+
+def compress_payload(payload, headers, tags=()):
+    """Compresses an encoded payload with gzip
+
+    The compressed payload is held in memory so its length is known for the
+    ``Content-Length`` header. Streamed parts are read from S3 here, so memory
+    usage is bounded by the compressed size of the crash rather than the stream
+    chunk size.
+
+    :arg payload: MultipartPayload
+    :arg headers: dict of headers for the payload
+    :arg tags: tags for metrics
+
+    :returns: tuple of (MultipartPayload, headers dict); the headers are a new
+        dict
+
+    """
+    start_time = time.perf_counter()
+    payload = MultipartPayload(gzip_parts(payload, level=CONFIG.compression_level))
+    compress_ms = (time.perf_counter() - start_time) * 1000
+
+    headers = dict(headers)
+    headers["Content-Length"] = str(len(payload))
+    headers["Content-Encoding"] = "gzip"
+
+    statsd_histogram(
+        "socorro.submitter.compressed_payload_bytes", len(payload), tags=tags
+    )
+    statsd_histogram("socorro.submitter.compress_ms", round(compress_ms, 3), tags=tags)
+    return payload, headers
+
+
+class PayloadCache:
+    """Encodes a crash's payload once for each variant destinations need
+
+    Destinations can ask for a different payload type or compression than the
+    crash was originally submitted with. Variants are encoded the first time a
+    destination asks for them and reused after that. Compressed variants are
+    derived from the uncompressed variant of the same payload type.
+
+    :arg raw_crash: dict of crash annotations with collector keys removed
+    :arg dumps: dict of dump name -> dump data
+    :arg payload_type: the payload type the crash was submitted with
+    :arg payload_compressed: whether the crash was submitted compressed
+    :arg user_agent: the User-Agent header to post with
+    :arg timings: PhaseTimings to record "encode" and "compress" phases in or
+        None
+
+    """
+
+    def __init__(
+        self,
+        raw_crash,
+        dumps,
+        payload_type,
+        payload_compressed,
+        user_agent,
+        timings=None,
+    ):
+        self.raw_crash = raw_crash
+        self.dumps = dumps
+        self.payload_type = payload_type
+        self.payload_compressed = payload_compressed
+        self.user_agent = user_agent
+        self.timings = timings
+
+        # Map of (payload type, payload compressed) -> (payload, headers)
+        self.variants = {}
+        self.lock = threading.Lock()
+
+    def get(self, payload_type=None, payload_compressed=None):
+        """Returns the payload and headers for a variant
+
+        :arg payload_type: "multipart", "json", or None for the original
+        :arg payload_compressed: "0", "1", or None for the original
+
+        :returns: tuple of (MultipartPayload, headers dict)
+
+        """
+        payload_type = payload_type or self.payload_type
+        payload_compressed = payload_compressed or self.payload_compressed
+        tags = get_payload_tags(payload_type, payload_compressed)
+        with self.lock:
+            return self._get(payload_type, payload_compressed, tags)
+
+    def _get(self, payload_type, payload_compressed, tags):
+        key = (payload_type, payload_compressed)
+        if key in self.variants:
+            return self.variants[key]
+
+        start_time = time.perf_counter()
+        if payload_compressed == "1":
+            payload, headers = self._get(payload_type, "0", tags)
+            start_time = time.perf_counter()
+            payload, headers = compress_payload(payload, headers, tags=tags)
+            phase = "compress"
+        else:
+            payload, headers = multipart_encode(
+                raw_crash=self.raw_crash,
+                dumps=self.dumps,
+                payload_type=payload_type,
+                payload_compressed="0",
+                tags=tags,
+            )
+            # Set the User-Agent header so the collector captures this in the
+            # metadata
+            headers["User-Agent"] = self.user_agent
+            phase = "encode"
+
+        if self.timings is not None:
+            if payload_type != self.payload_type:
+                phase = "%s:%s" % (phase, payload_type)
+            self.timings.add(
+                phase, (time.perf_counter() - start_time) * 1000, size=len(payload)
+            )
+
+        self.variants[key] = (payload, headers)
+        return payload, headers
+
+
+# Map of (destination url, pool size) -> requests.Session; this persists
+# across warm Lambda invocations
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+# Map of (destination url, pool size) -> (connections, requests) counts at the
+# time pool stats were last emitted
+_SESSION_STATS = {}
+
+
+def get_session(url):
+    """Returns a persistent requests Session for posting to a destination url
+
+    The session keeps connections alive and is reused across crashes and across
+    warm Lambda invocations. Its connection pool holds up to
+    ``CONFIG.http_pool_size`` connections.
+
+    :arg url: the destination url
+
+    :returns: requests.Session
+
+    """
+    import requests
+    import requests.adapters
+
+    key = (url, CONFIG.http_pool_size)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=CONFIG.http_pool_size
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SESSIONS[key] = session
+    return session
+
+
+def get_session_pool_stats(session):
+    """Returns (connections created, requests made) for a session's pools"""
+    num_connections = 0
+    num_requests = 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for pool_key in pools.keys():
+            pool = pools.get(pool_key)
+            if pool is not None:
+                num_connections += pool.num_connections
+                num_requests += pool.num_requests
+    return num_connections, num_requests
+
+
+def emit_session_pool_stats():
+    """Emits connection pool metrics for sessions since the last time this ran
+
+    This emits:
+
+    * ``socorro.submitter.http_connection_created``: new connections
+    * ``socorro.submitter.http_connection_reused``: requests that reused an
+      existing connection
+
+    """
+    with _SESSIONS_LOCK:
+        sessions = list(_SESSIONS.items())
+
+    created = 0
+    reused = 0
+    for key, session in sessions:
+        num_connections, num_requests = get_session_pool_stats(session)
+        last_connections, last_requests = _SESSION_STATS.get(key, (0, 0))
+        _SESSION_STATS[key] = (num_connections, num_requests)
+
+        new_connections = num_connections - last_connections
+        new_requests = num_requests - last_requests
+        created += new_connections
+        reused += max(new_requests - new_connections, 0)
+
+    if created:
+        statsd_incr("socorro.submitter.http_connection_created", value=created)
+    if reused:
+        statsd_incr("socorro.submitter.http_connection_reused", value=reused)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a destination's circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Tracks failures for a destination and stops posts while it's failing
+
+    The breaker opens when ``failure_threshold`` failures happen within
+    ``window`` seconds. While it's open, posts are not allowed. After
+    ``cooldown`` seconds, one trial post is allowed. If that succeeds, the
+    breaker closes. If that fails, it opens again.
+
+    :arg failure_threshold: number of failures that opens the breaker; 0 means
+        never open
+    :arg window: seconds failures are counted for
+    :arg cooldown: seconds to wait before allowing a trial post
+
+    """
+
+    def __init__(self, failure_threshold, window, cooldown):
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.cooldown = cooldown
+
+        self.failures = []
+        self.opened_at = None
+        self.trial_in_progress = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Returns whether a post is allowed"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+
+            if (
+                not self.trial_in_progress
+                and time.monotonic() - self.opened_at >= self.cooldown
+            ):
+                self.trial_in_progress = True
+                return True
+
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = []
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def release(self):
+        """Ends a trial post that neither succeeded nor failed"""
+        with self.lock:
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        """Records a failure
+
+        :returns: True if this failure opened the breaker
+
+        """
+        if self.failure_threshold <= 0:
+            return False
+
+        with self.lock:
+            now = time.monotonic()
+            if self.opened_at is not None:
+                # The trial post failed, so wait another cooldown
+                self.opened_at = now
+                self.trial_in_progress = False
+                return False
+
+            self.failures = [
+                failure for failure in self.failures if now - failure < self.window
+            ]
+            self.failures.append(now)
+            if len(self.failures) >= self.failure_threshold:
+                self.failures = []
+                self.opened_at = now
+                return True
+
+            return False
+
+
+# Map of (destination url, threshold, window, cooldown) -> CircuitBreaker;
+# this persists across warm Lambda invocations
+_CIRCUIT_BREAKERS = {}
+_CIRCUIT_BREAKERS_LOCK = threading.Lock()
+
+
+def get_circuit_breaker(url):
+    """Returns the CircuitBreaker for a destination url"""
+    key = (
+        url,
+        CONFIG.circuit_breaker_threshold,
+        CONFIG.circuit_breaker_window,
+        CONFIG.circuit_breaker_cooldown,
+    )
+    with _CIRCUIT_BREAKERS_LOCK:
+        breaker = _CIRCUIT_BREAKERS.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(*key[1:])
+            _CIRCUIT_BREAKERS[key] = breaker
+    return breaker
+
+
+class RateLimitedError(Exception):
+    """Raised when a crash would wait too long for a destination's rate limit"""
+
+
+class DestinationRateLimitedError(RateLimitedError):
+    """Raised when a destination keeps asking for posts to slow down
+
+    This is a 429 response or a 503 response with a ``Retry-After`` header
+    after retries.
+
+    """
+
+
+class TokenBucket:
+    """Token bucket that refills at a rate and holds up to a second's worth
+
+    Taking more tokens than are available leaves the bucket in debt, so large
+    amounts (like big payloads) are allowed and make later takers wait.
+
+    This isn't thread-safe; RateLimiter locks around it.
+
+    :arg rate: tokens added per second
+
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(rate, 1)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.last_refill) * self.rate
+        )
+        self.last_refill = now
+
+    def wait_time(self, amount, now):
+        """Returns seconds until amount tokens can be taken"""
+        self.refill(now)
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """Per-destination limits on crashes per second and bytes per second
+
+    The destination can also ask for posts to pause (for example, with a
+    ``Retry-After`` header).
+
+    :arg rate: crashes per second; 0 means no limit
+    :arg byte_rate: bytes per second; 0 means no limit
+
+    """
+
+    def __init__(self, rate, byte_rate):
+        self.buckets = []
+        if rate > 0:
+            self.buckets.append((TokenBucket(rate), lambda size: 1))
+        if byte_rate > 0:
+            self.buckets.append((TokenBucket(byte_rate), lambda size: size))
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, size, max_wait):
+        """Reserves a post of size bytes
+
+        :arg size: size of the payload in bytes
+        :arg max_wait: maximum seconds the caller is willing to wait
+
+        :returns: seconds the caller must wait before posting or None if that's
+            more than max_wait, in which case nothing was reserved
+
+        """
+        with self.lock:
+            now = time.monotonic()
+            wait = max(self.paused_until - now, 0.0)
+            for bucket, amount in self.buckets:
+                wait = max(wait, bucket.wait_time(amount(size), now))
+
+            if wait > max_wait:
+                return None
+
+            for bucket, amount in self.buckets:
+                bucket.take(amount(size))
+            return wait
+
+    def pause(self, seconds):
+        """Pauses posts for seconds"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+# Map of (destination url, rate, byte rate) -> RateLimiter; this persists
+# across warm Lambda invocations
+_RATE_LIMITERS = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(destination):
+    """Returns the RateLimiter for a destination"""
+    key = (destination.url, destination.rate, destination.byte_rate)
+    with _RATE_LIMITERS_LOCK:
+        limiter = _RATE_LIMITERS.get(key)
+        if limiter is None:
+            limiter = RateLimiter(destination.rate, destination.byte_rate)
+            _RATE_LIMITERS[key] = limiter
+    return limiter
+
+
+class SubmittedCache:
+    """Bounded record of (crash id, destination url) pairs that were submitted
+
+    Pairs are forgotten after ``ttl`` seconds or when the cache is full and
+    they're the least recently used.
+
+    :arg max_size: maximum number of pairs to remember; 0 means none
+    :arg ttl: seconds to remember a pair for
+
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        # Map of (crash id, url) -> time submitted
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            submitted = self.entries.get(key)
+            if submitted is None:
+                return False
+            if time.monotonic() - submitted >= self.ttl:
+                del self.entries[key]
+                return False
+            self.entries.move_to_end(key)
+            return True
+
+    def add(self, key):
+        if self.max_size <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = time.monotonic()
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+# Map of (max size, ttl) -> SubmittedCache; this persists across warm Lambda
+# invocations
+_SUBMITTED_CACHES = {}
+_SUBMITTED_CACHES_LOCK = threading.Lock()
+
+
+def get_submitted_cache():
+    """Returns the SubmittedCache for the configured size and ttl"""
+    key = (CONFIG.dedup_cache_size, CONFIG.dedup_cache_ttl)
+    with _SUBMITTED_CACHES_LOCK:
+        cache = _SUBMITTED_CACHES.get(key)
+        if cache is None:
+            cache = SubmittedCache(*key)
+            _SUBMITTED_CACHES[key] = cache
+    return cache
+
+
+def get_retry_after(resp):
+    """Returns seconds from a response's Retry-After header or None
+
+    :arg resp: requests.Response
+
+    """
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    # It can also be an HTTP date
+    try:
+        import email.utils
+
+        retry_time = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_time.timestamp() - time.time(), 0.0)
+
+
+def wait_for_rate_limit(crash_id, destination, size, tags=()):
+    """Waits until a crash can be posted to a destination without going over its
+    rate limit
+
+    :arg crash_id: the crash id
+    :arg destination: Destination instance
+    :arg size: size of the payload in bytes
+    :arg tags: tags for metrics
+
+    :returns: True if the crash can be posted and False if it should be
+        dropped for this destination
+
+    :raises RateLimitedError: if the crash would need to wait longer than
+        ``CONFIG.rate_limit_max_delay``
+
+    """
+    limiter = get_rate_limiter(destination)
+    if destination.rate_limit_policy == "shed":
+        if limiter.acquire(size, max_wait=0) is None:
+            statsd_incr("socorro.submitter.rate_limit_dropped", tags=tags)
+            LOGGER.info(
+                "rate limited--dropping: %s %s",
+                crash_id,
+                get_destination_name(destination.url),
+            )
+            return False
+        return True
+
+    wait = limiter.acquire(size, max_wait=CONFIG.rate_limit_max_delay)
+    if wait is None:
+        statsd_incr("socorro.submitter.rate_limit_exceeded", tags=tags)
+        raise RateLimitedError(
+            "rate limited for more than %ss: %s"
+            % (CONFIG.rate_limit_max_delay, get_destination_name(destination.url))
+        )
+
+    if wait > 0:
+        statsd_incr("socorro.submitter.rate_limit_delayed", tags=tags)
+        statsd_histogram(
+            "socorro.submitter.rate_limit_delay_ms", round(wait * 1000, 3), tags=tags
+        )
+        time.sleep(wait)
+    return True
+
+
+def post_with_retries(destination, payload, headers, tags=()):
+    """Posts a payload to a destination and retries on connection errors and 5xx
+
+    Retries wait a random amount of time up to ``CONFIG.http_retry_backoff``
+    seconds doubled for every retry so retries from many crashes are spread
+    out. Read timeouts aren't retried because the destination might have
+    received the crash.
+
+    429 and 503 responses are retried too. If they have a ``Retry-After``
+    header, all posts to the destination are paused for that long.
+
+    :arg destination: Destination instance
+    :arg payload: the payload
+    :arg headers: dict of HTTP headers
+    :arg tags: tags for metrics
+
+    :returns: the last response
+
+    :raises requests.exceptions.RequestException: if the last try raised an
+        error
+
+    """
+    import requests
+
+    session = get_session(destination.url)
+    retries = max(CONFIG.http_retries, 0)
+    retry_after = None
+    for attempt in range(retries + 1):
+        if attempt:
+            statsd_incr("socorro.submitter.httppost_retry", tags=tags)
+            delay = CONFIG.http_retry_backoff * (2 ** (attempt - 1))
+            time.sleep(max(random.uniform(0, delay), retry_after or 0))
+
+        # Only the response to the previous try says how long to wait
+        retry_after = None
+        try:
+            resp = session.post(
+                destination.url,
+                headers=headers,
+                data=payload,
+                timeout=(destination.connect_timeout, destination.timeout),
+            )
+        except requests.exceptions.ConnectionError:
+            if attempt == retries:
+                raise
+            continue
+
+        if resp.status_code in (429, 503):
+            retry_after = get_retry_after(resp)
+            if retry_after is not None:
+                statsd_incr("socorro.submitter.retry_after", tags=tags)
+                get_rate_limiter(destination).pause(retry_after)
+                if retry_after > CONFIG.rate_limit_max_delay:
+                    # Don't wait that long--let the crash get retried later
+                    return resp
+
+        if (resp.status_code < 500 and resp.status_code != 429) or attempt == retries:
+            return resp
+
+
+def post_crash(crash_id, destination, payload, headers, tags=(), timings=None):
+    """Posts a crash payload to a destination
+
+    :arg crash_id: the crash id
+    :arg destination: Destination instance
+    :arg payload: the payload
+    :arg headers: dict of HTTP headers
+    :arg tags: tags for metrics; the destination tag is added to these
+    :arg timings: PhaseTimings to record a "post:<destination>" phase in or None
+
+    :raises CircuitOpenError: if the destination's circuit breaker is open
+    :raises RateLimitedError: if the crash would wait too long for the
+        destination's rate limit
+    :raises DestinationRateLimitedError: if the destination kept asking for
+        posts to slow down
+    :raises StreamFetchError: if fetching streamed data from S3 failed while
+        posting
+    :raises requests.exceptions.RequestException: if posting failed or the
+        destination responded with a 5xx or 429 after retries
+
+    """
+    import requests
+
+    name = get_destination_name(destination.url)
+    tags = tuple(tags) + ("destination:%s" % name,)
+
+    if not wait_for_rate_limit(crash_id, destination, len(payload), tags=tags):
+        return
+
+    breaker = get_circuit_breaker(destination.url)
+    if not breaker.allow():
+        statsd_incr("socorro.submitter.circuit_open", tags=tags)
+        raise CircuitOpenError("circuit breaker open for %s" % name)
 
-    return output, headers
+    start_time = time.perf_counter()
+    try:
+        # POST crash to new environment
+        resp = post_with_retries(destination, payload, headers, tags=tags)
+        statsd_incr(
+            "socorro.submitter.httppost_status",
+            tags=tags + ("status:%d" % resp.status_code,),
+        )
+        if resp.status_code == 429 or (
+            resp.status_code == 503 and get_retry_after(resp) is not None
+        ):
+            raise DestinationRateLimitedError(
+                "%s responded with %d" % (name, resp.status_code)
+            )
+        if resp.status_code >= 500:
+            resp.raise_for_status()
+
+    except DestinationRateLimitedError as exc:
+        # The destination is working and asking for fewer posts, so this
+        # doesn't count against it
+        breaker.release()
+        statsd_incr("socorro.submitter.rate_limit_rejected", tags=tags)
+        LOGGER.warning("rate limited by destination: %s %s (%s)", crash_id, name, exc)
+        raise
+
+    except StreamFetchError:
+        # This is a problem with S3 rather than the destination, so it doesn't
+        # count against the destination
+        breaker.release()
+        statsd_incr("socorro.submitter.stream_fetch_error", tags=tags)
+        LOGGER.exception("Error: fetching streamed data failed: %s %s", crash_id, name)
+        raise
+
+    except Exception as exc:
+        if breaker.record_failure():
+            statsd_incr("socorro.submitter.circuit_opened", tags=tags)
+            LOGGER.warning("circuit breaker opened for %s", name)
+
+        if isinstance(exc, requests.exceptions.Timeout):
+            statsd_incr("socorro.submitter.httppost_timeout", tags=tags)
+            LOGGER.error("Error: http post timed out: %s %s (%s)", crash_id, name, exc)
+        else:
+            statsd_incr("socorro.submitter.unknown_httppost_error", tags=tags)
+            LOGGER.exception(
+                "Error: http post failed for unknown reason: %s %s", crash_id, name
+            )
+        raise
+
+    else:
+        breaker.record_success()
+        get_submitted_cache().add((crash_id, destination.url))
+
+    finally:
+        post_ms = (time.perf_counter() - start_time) * 1000
+        statsd_histogram("socorro.submitter.post_ms", round(post_ms, 3), tags=tags)
+        if timings is not None:
+            timings.add("post:%s" % name, post_ms, size=len(payload))
 
 
 def get_payload_type(raw_crash):
@@ -423,11 +1985,213 @@ def get_payload_compressed(raw_crash):
     return "0"
 
 
-def handler(event, context):
-    crash_ids = []
+def get_crash_id_sample(crash_id):
+    """Returns a number from 0 to 99 derived from the crash id
 
-    LOGGER.debug("number of records: %d", len(event["Records"]))
+    The same crash id always gets the same number.
+
+    """
+    return zlib.crc32(crash_id.encode("utf-8")) % 100
+
+
+def is_throttled(crash_id, destination):
+    """Returns whether a crash should be throttled for a destination
+
+    If ``CONFIG.throttle_mode`` is "hash", this is based on a hash of the crash
+    id, so the same crash id is always throttled the same way for a given
+    throttle value. Otherwise, this rolls a die.
+
+    :arg crash_id: the crash id
+    :arg destination: Destination instance
+
+    :returns: True if the crash should not be submitted to the destination
+
+    """
+    if destination.throttle >= 100:
+        return False
+
+    if CONFIG.throttle_mode == "hash":
+        return get_crash_id_sample(crash_id) >= destination.throttle
+
+    return random.randint(0, 100) > destination.throttle
+
+
+def handle_fetch_error(crash_id, exc):
+    """Counts and logs an error fetching a crash
+
+    :arg crash_id: the crash id
+    :arg exc: the exception
+
+    :returns: True if the crash should be skipped and False if the error should
+        be re-raised
+
+    """
+    if isinstance(exc, CrashTooLargeError):
+        # Retrying won't make the crash smaller, so skip it
+        statsd_incr("socorro.submitter.crash_too_large", value=1)
+        LOGGER.warning("crash too large--skipping: %s (%s)", crash_id, exc)
+        return True
+
+    statsd_incr("socorro.submitter.unknown_s3fetch_error", value=1)
+    LOGGER.error(
+        "Error: s3 fetch failed for unknown reason: %s", crash_id, exc_info=exc
+    )
+    return False
+
+
+def prepare_payloads(raw_crash, dumps, timings):
+    """Returns a PayloadCache for a fetched crash
+
+    :arg raw_crash: the raw crash dict; collector keys are removed from it
+    :arg dumps: dict of dump name -> dump data
+    :arg timings: PhaseTimings with the fetch phases
+
+    :returns: PayloadCache
+
+    """
+    payload_type = get_payload_type(raw_crash)
+    payload_compressed = get_payload_compressed(raw_crash)
+
+    # Get the metadata.user_agent if there is one, or use default agent
+    user_agent = raw_crash.get("metadata", {}).get("user_agent") or DEFAULT_USER_AGENT
+
+    # Remove keys created by the collector from the raw crash
+    raw_crash = remove_collector_keys(raw_crash)
+
+    tags = get_payload_tags(payload_type, payload_compressed)
+    for phase in ("fetch_raw_crash", "fetch_dumps"):
+        statsd_histogram(
+            "socorro.submitter.%s_ms" % phase, timings.phases[phase]["ms"], tags=tags
+        )
+
+    # Payloads are encoded when the first destination that needs them asks for
+    # them
+    return PayloadCache(
+        raw_crash=raw_crash,
+        dumps=dumps,
+        payload_type=payload_type,
+        payload_compressed=payload_compressed,
+        user_agent=user_agent,
+        timings=timings,
+    )
+
+
+def post_payload(crash_id, payloads, destination, timings=None):
+    """Posts the payload variant a destination needs to the destination
+
+    :arg crash_id: the crash id
+    :arg payloads: PayloadCache for the crash
+    :arg destination: Destination instance
+    :arg timings: PhaseTimings or None
+
+    """
+    payload_type = destination.payload_type or payloads.payload_type
+    payload_compressed = destination.payload_compressed or payloads.payload_compressed
+    payload, headers = payloads.get(payload_type, payload_compressed)
+    post_crash(
+        crash_id,
+        destination,
+        payload,
+        headers,
+        tags=get_payload_tags(payload_type, payload_compressed),
+        timings=timings,
+    )
+
+
+def process_crash(client, crash_id, destinations):
+    """Fetches crash data, encodes it, and posts it to destinations
+
+    :arg client: S3 client
+    :arg crash_id: the crash id to process
+    :arg destinations: list of Destination instances to post to; throttling
+        has already been applied
+
+    """
+    timings = PhaseTimings()
+
+    # Fetch the crash report data
+    try:
+        # Fetch raw crash data from S3
+        raw_crash, dumps = fetch_crash(
+            client, CONFIG.s3_bucket, crash_id, timings=timings
+        )
+    except Exception as exc:
+        if handle_fetch_error(crash_id, exc):
+            return
+        raise
+
+    try:
+        payloads = prepare_payloads(raw_crash, dumps, timings)
+
+        # Post to all destinations in parallel--a destination failing doesn't
+        # stop the payload from being posted to the others; the first error is
+        # re-raised after all posts are done
+        map_concurrently(
+            lambda destination: post_payload(crash_id, payloads, destination, timings),
+            destinations,
+            max_workers=len(destinations),
+        )
+
+    finally:
+        if CONFIG.log_crash_timings:
+            log_crash_timings(crash_id, timings)
+
+
+def log_crash_timings(crash_id, timings):
+    """Logs a line with milliseconds and bytes per phase for a crash
+
+    :arg crash_id: the crash id
+    :arg timings: PhaseTimings for the crash
+
+    """
+    summary = dict(timings.phases)
+    LOGGER.info(
+        "crash timings: %s %s",
+        crash_id,
+        json.dumps(summary, sort_keys=True),
+        extra={"crash_id": crash_id, "timings": summary},
+    )
+
+
+def get_s3_records(event):
+    """Yields the S3 event records in a Lambda event
+
+    S3 notifications can invoke the Lambda function directly or be delivered
+    through an SQS queue. Records delivered directly have no message id.
+
+    :arg event: the Lambda event
+
+    :returns: generator of (S3 event record, SQS message id or None)
+
+    """
     for record in event["Records"]:
+        if record["eventSource"] != "aws:sqs":
+            yield record, None
+            continue
+
+        # The SQS message body is an S3 notification with its own records
+        try:
+            body = json.loads(record["body"])
+        except (KeyError, ValueError):
+            LOGGER.exception("%s: can't parse SQS message", record.get("messageId"))
+            continue
+
+        for s3_record in body.get("Records", []):
+            yield s3_record, record["messageId"]
+
+
+def get_batch_items(event):
+    """Returns the crash ids for raw crashes saved in an S3 event
+
+    :arg event: the Lambda event
+
+    :returns: list of (crash id, SQS message id or None) tuples
+
+    """
+    items = []
+
+    LOGGER.debug("number of records: %d", len(event["Records"]))
+    for record, message_id in get_s3_records(event):
         # Skip anything that's not an S3 ObjectCreated:put event
         if (
             record["eventSource"] != "aws:s3"
@@ -444,84 +2208,445 @@ def handler(event, context):
             continue
 
         LOGGER.debug("saw crash id: %s in %s", crash_id, bucket)
-        crash_ids.append(crash_id)
+        items.append((crash_id, message_id))
+
+    return items
+
+
+def build_response(failures, items):
+    """Returns the handler response for crashes that failed
+
+    Lambda only uses partial batch failure responses for SQS event source
+    mappings, so crashes that weren't delivered through SQS always raise.
+
+    :arg failures: list of (crash id, exception) tuples
+    :arg items: list of (crash id, SQS message id or None) tuples for the event
+
+    :returns: None if nothing failed or a partial batch failure response listing
+        the SQS messages with crashes that failed if
+        ``CONFIG.partial_batch_failures`` is True
+
+    :raises Exception: the first failure if ``CONFIG.partial_batch_failures``
+        is False or a crash that failed wasn't delivered through SQS
+
+    """
+    if not failures:
+        return
+
+    if CONFIG.partial_batch_failures:
+        message_ids = {}
+        for crash_id, message_id in items:
+            message_ids.setdefault(crash_id, []).append(message_id)
+
+        failed_message_ids = [
+            message_id
+            for crash_id, _ in failures
+            for message_id in message_ids.get(crash_id, [None])
+        ]
+        if None not in failed_message_ids:
+            # Report only the messages with crashes that failed so only those
+            # get retried
+            return {
+                "batchItemFailures": [
+                    {"itemIdentifier": message_id}
+                    for message_id in dict.fromkeys(failed_message_ids)
+                ]
+            }
+
+    # Raise the first error so the whole batch gets retried
+    raise failures[0][1]
+
+
+class DeadlineExceededError(Exception):
+    """Raised for crashes that weren't started because time was running out"""
+
+
+class LatencyAverage:
+    """Thread-safe exponentially weighted moving average of latencies
+
+    :arg weight: how much each new latency counts towards the average
+
+    """
+
+    def __init__(self, weight=0.2):
+        self.weight = weight
+        self.lock = threading.Lock()
+        self.average = None
+
+    def add(self, seconds):
+        with self.lock:
+            if self.average is None:
+                self.average = seconds
+            else:
+                self.average += self.weight * (seconds - self.average)
+
+    def reset(self):
+        with self.lock:
+            self.average = None
+
+
+# Seconds it takes to process a crash; this persists across warm Lambda
+# invocations so the first crashes in an invocation have an estimate
+CRASH_LATENCY = LatencyAverage()
+
+
+class Deadline:
+    """Decides whether there's enough time left in an invocation for a crash
+
+    :arg context: the Lambda context or None if there's no deadline
+    :arg margin: seconds to leave at the end of the invocation
+
+    """
+
+    def __init__(self, context, margin):
+        self.get_remaining_time_in_millis = getattr(
+            context, "get_remaining_time_in_millis", None
+        )
+        self.margin = margin
+
+    def can_start(self):
+        """Returns whether a crash started now would finish in time"""
+        if self.get_remaining_time_in_millis is None:
+            return True
+
+        remaining = self.get_remaining_time_in_millis() / 1000 - self.margin
+        return remaining > (CRASH_LATENCY.average or 0)
+
+    def error(self, crash_id):
+        return DeadlineExceededError("not enough time left: %s" % crash_id)
+
+
+def handler(event, context):
+    ensure_logging_set_up()
+
+    items = get_batch_items(event)
+    crash_ids = [crash_id for crash_id, _ in items]
 
     # If we don't have anything to post, we're done!
     if not crash_ids:
         return
 
-    # Build s3 client
-    client = build_s3_client(
-        access_key=CONFIG.s3_access_key,
-        secret_access_key=CONFIG.s3_secret_access_key,
-        region_name=CONFIG.s3_region_name,
-        endpoint_url=CONFIG.s3_endpoint_url,
-    )
+    try:
+        failures = process_crashes(crash_ids, Deadline(context, CONFIG.deadline_margin))
+    finally:
+        flush_metrics_and_logs()
 
-    destinations = CONFIG.get_destinations()
+    return build_response(failures, items)
 
-    for crash_id in crash_ids:
-        submit_destinations = []
 
-        # Figure out which destinations we're sending to
+def get_crashes_to_submit(crash_ids, ignore_throttle=False):
+    """Throttles a batch of crashes and skips ones that were already submitted
+
+    Crash ids that are in the batch more than once are only processed once.
+    Crashes that were recently submitted to a destination (for example, in an
+    earlier invocation that failed for another crash) aren't submitted to it
+    again.
+
+    :arg crash_ids: list of crash ids
+    :arg ignore_throttle: if True, crashes aren't throttled
+
+    :returns: list of (crash id, list of Destination instances) for crashes that
+        weren't throttled or already submitted for at least one destination
+
+    """
+    destinations = CONFIG.get_destinations()
+    submitted = get_submitted_cache()
+
+    unique_crash_ids = list(dict.fromkeys(crash_ids))
+    duplicates = len(crash_ids) - len(unique_crash_ids)
+
+    # Figure out which destinations each crash is going to before fetching
+    # anything
+    accepted = 0
+    throttled = 0
+    dedup_hits = 0
+    dedup_misses = 0
+    crashes_to_submit = []
+    for crash_id in unique_crash_ids:
+        submit_destinations = []
         for destination in destinations:
-            if (
-                destination.throttle < 100
-                and random.randint(0, 100) > destination.throttle
-            ):
-                LOGGER.info("throttled: %s (%r)", crash_id, destination)
-                statsd_incr("socorro.submitter.throttled", value=1)
+            if not ignore_throttle and is_throttled(crash_id, destination):
+                LOGGER.debug("throttled: %s (%r)", crash_id, destination)
+                throttled += 1
+                continue
+
+            if (crash_id, destination.url) in submitted:
+                LOGGER.debug("already submitted: %s (%r)", crash_id, destination)
+                dedup_hits += 1
                 continue
 
-            statsd_incr("socorro.submitter.accept", value=1)
+            dedup_misses += 1
+            accepted += 1
             submit_destinations.append(destination)
 
-        # If there's nowhere to send to, move on to next crash_id
-        if not submit_destinations:
+        if submit_destinations:
+            crashes_to_submit.append((crash_id, submit_destinations))
+
+    # Emit counts once per invocation rather than once per decision
+    if accepted:
+        statsd_incr("socorro.submitter.accept", value=accepted)
+    if throttled:
+        statsd_incr("socorro.submitter.throttled", value=throttled)
+    if duplicates:
+        statsd_incr("socorro.submitter.duplicate_record", value=duplicates)
+    if dedup_hits:
+        statsd_incr("socorro.submitter.dedup_hit", value=dedup_hits)
+    if dedup_misses:
+        statsd_incr("socorro.submitter.dedup_miss", value=dedup_misses)
+
+    return crashes_to_submit
+
+
+def get_failures(results):
+    """Returns and counts the failures in a list of process results
+
+    :arg results: list of None or (crash id, exception) for each crash
+
+    :returns: list of (crash id, exception) tuples
+
+    """
+    failures = [result for result in results if result is not None]
+    if failures:
+        statsd_incr("socorro.submitter.crash_failed", value=len(failures))
+
+    # Crashes that weren't started are failures so they get redelivered
+    not_started = sum(
+        1 for _, exc in failures if isinstance(exc, DeadlineExceededError)
+    )
+    if not_started:
+        LOGGER.warning("ran out of time: %d crashes not processed", not_started)
+        statsd_incr("socorro.submitter.deadline_skipped", value=not_started)
+    return failures
+
+
+def process_crashes(crash_ids, deadline):
+    """Throttles and processes a batch of crashes
+
+    Every crash is processed even if processing an earlier one fails. Crashes
+    aren't started when there isn't enough time left to process them before the
+    deadline; those fail with a DeadlineExceededError.
+
+    :arg crash_ids: list of crash ids
+    :arg deadline: Deadline
+
+    :returns: list of (crash id, exception) tuples for crashes that failed
+
+    """
+    crashes_to_submit = get_crashes_to_submit(crash_ids)
+
+    # If everything was throttled, we're done
+    if not crashes_to_submit:
+        return []
+
+    # Get s3 client
+    client = get_s3_client()
+
+    def _process_crash(item):
+        crash_id, submit_destinations = item
+        if not deadline.can_start():
+            return crash_id, deadline.error(crash_id)
+
+        start_time = time.perf_counter()
+        try:
+            process_crash(client, crash_id, submit_destinations)
+        except Exception as exc:
+            return crash_id, exc
+        finally:
+            CRASH_LATENCY.add(time.perf_counter() - start_time)
+        return None
+
+    # Process crashes--if CONFIG.concurrency is greater than 1, this processes
+    # that many crashes in parallel
+    try:
+        results = map_concurrently(
+            _process_crash, crashes_to_submit, max_workers=CONFIG.concurrency
+        )
+    finally:
+        emit_session_pool_stats()
+
+    return get_failures(results)
+
+
+def read_crash_ids(fp):
+    """Yields crash ids from a file with one crash id per line
+
+    Blank lines and lines starting with ``#`` are skipped.
+
+    :arg fp: file-like object
+
+    :raises ValueError: if a line isn't a crash id
+
+    """
+    for line in fp:
+        line = line.strip()
+        if not line or line.startswith("#"):
             continue
+        if not is_crash_id(line):
+            raise ValueError("%r is not a crash id" % line)
+        yield line
+
+
+def list_crash_ids(client, bucket, prefix):
+    """Yields crash ids for raw crashes in S3 with keys that start with prefix
+
+    :arg client: S3 client
+    :arg bucket: S3 bucket name
+    :arg prefix: key prefix like ``v1/raw_crash/20231017/``
+
+    """
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get("Contents", []):
+            crash_id = item["Key"].rsplit("/", 1)[-1]
+            if is_crash_id(crash_id):
+                yield crash_id
+
 
-        # Fetch the crash report data
+def percentile(values, pct):
+    """Returns the pct percentile of a sorted list of values"""
+    if not values:
+        return 0
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def backfill(crash_ids, workers, rate, ignore_throttle=False):
+    """Submits a list of crashes with a pool of workers at a target rate
+
+    :arg crash_ids: list of crash ids
+    :arg workers: number of crashes to process at a time
+    :arg rate: maximum number of crashes to start per second; 0 means no limit
+    :arg ignore_throttle: if True, crashes are submitted to all destinations
+        regardless of their throttle
+
+    :returns: dict with the number of crashes attempted, succeeded, skipped and
+        failed, failed crash ids, elapsed seconds, crashes attempted per second,
+        and latency percentiles in milliseconds
+
+    """
+    import concurrent.futures
+
+    crashes_to_submit = get_crashes_to_submit(
+        crash_ids, ignore_throttle=ignore_throttle
+    )
+
+    client = get_s3_client()
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(max(workers, 1))
+
+    def _process_crash(crash_id, submit_destinations):
+        start_time = time.perf_counter()
         try:
-            # Fetch raw crash data from S3
-            raw_crash = fetch_raw_crash(client, CONFIG.s3_bucket, crash_id)
-            dumps = fetch_dumps(client, CONFIG.s3_bucket, crash_id)
+            process_crash(client, crash_id, submit_destinations)
+        except Exception as exc:
+            with lock:
+                failures.append((crash_id, exc))
+        finally:
+            with lock:
+                latencies.append((time.perf_counter() - start_time) * 1000)
+            slots.release()
+
+    start_time = time.monotonic()
+    next_start = start_time
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for crash_id, submit_destinations in crashes_to_submit:
+            # Pace the start of each crash to keep to the rate
+            if rate > 0:
+                delay = next_start - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            # Wait for a worker so crashes aren't queued up behind the pacing
+            slots.acquire()
+
+            # Pace from when this crash actually started so crashes that were
+            # held up waiting for a worker don't all start at once
+            if rate > 0:
+                next_start = max(next_start, time.monotonic()) + 1 / rate
+            executor.submit(_process_crash, crash_id, submit_destinations)
+
+    elapsed = time.monotonic() - start_time
+    emit_session_pool_stats()
+    get_failures(failures)
+    flush_metrics_and_logs()
+
+    latencies.sort()
+    return {
+        "attempted": len(latencies),
+        "succeeded": len(latencies) - len(failures),
+        "skipped": len(crash_ids) - len(crashes_to_submit),
+        "failed": len(failures),
+        "failed_crash_ids": [crash_id for crash_id, _ in failures],
+        "elapsed_seconds": round(elapsed, 3),
+        "crashes_per_second": round(len(latencies) / elapsed, 3) if elapsed else 0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0,
+        },
+    }
 
-            payload_type = get_payload_type(raw_crash)
-            payload_compressed = get_payload_compressed(raw_crash)
 
-            # Get the metadata.user_agent if there is one, or use default agent
-            user_agent = (
-                raw_crash.get("metadata", {}).get("user_agent") or DEFAULT_USER_AGENT
-            )
+def main(argv):
+    """Submits crashes from the command line
 
-            # Remove keys created by the collector from the raw crash
-            raw_crash = remove_collector_keys(raw_crash)
+    This is for backfilling a destination with crashes that are already in S3.
 
-        except Exception:
-            statsd_incr("socorro.submitter.unknown_s3fetch_error", value=1)
-            LOGGER.exception("Error: s3 fetch failed for unknown reason: %s", crash_id)
-            raise
+    """
+    import argparse
 
-        # Assemble payload and headers
-        payload, headers = multipart_encode(
-            raw_crash=raw_crash,
-            dumps=dumps,
-            payload_type=payload_type,
-            payload_compressed=payload_compressed,
+    parser = argparse.ArgumentParser(
+        description="Submits crashes in S3 to the configured destinations."
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--file",
+        type=argparse.FileType("r"),
+        help="file with one crash id per line; - for stdin",
+    )
+    source.add_argument(
+        "--s3-prefix",
+        help="submit raw crashes with keys starting with this like v1/raw_crash/20231017/",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=max(CONFIG.concurrency, 4),
+        help="number of crashes to process at a time",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="maximum crashes per second to submit; 0 means no limit",
+    )
+    parser.add_argument(
+        "--ignore-throttle",
+        action="store_true",
+        help="submit every crash to every destination regardless of throttle",
+    )
+    args = parser.parse_args(argv)
+
+    ensure_logging_set_up()
+
+    if args.file:
+        crash_ids = list(read_crash_ids(args.file))
+    else:
+        crash_ids = list(
+            list_crash_ids(get_s3_client(), CONFIG.s3_bucket, args.s3_prefix)
         )
 
-        # Set the User-Agent header so the collector captures this in the metadata
-        headers["User-Agent"] = user_agent
+    report = backfill(
+        crash_ids,
+        workers=args.workers,
+        rate=args.rate,
+        ignore_throttle=args.ignore_throttle,
+    )
+    print(json.dumps(report, indent=2))
+    return 1 if report["failed"] else 0
 
-        # Post to all destinations
-        for destination in submit_destinations:
-            try:
-                # POST crash to new environment
-                requests.post(destination.url, headers=headers, data=payload)
 
-            except Exception:
-                statsd_incr("socorro.submitter.unknown_httppost_error", value=1)
-                LOGGER.exception(
-                    "Error: http post failed for unknown reason: %s", crash_id
-                )
-                raise
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
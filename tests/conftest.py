@@ -19,7 +19,33 @@ import pytest
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "build"))
 
 
-from submitter import build_s3_client, CONFIG, generate_s3_key, handler  # noqa
+import submitter  # noqa
+from submitter import (  # noqa
+    build_s3_client,
+    CONFIG,
+    ensure_logging_set_up,
+    generate_s3_key,
+    handler,
+)
+
+
+# Set up logging now rather than during the first test that invokes the handler
+# so it doesn't remove pytest's log capturing handler
+ensure_logging_set_up()
+
+
+@pytest.fixture(autouse=True)
+def reset_module_state():
+    """Resets state that persists across invocations so tests are independent"""
+    submitter._CIRCUIT_BREAKERS.clear()
+    submitter._RATE_LIMITERS.clear()
+    submitter._SUBMITTED_CACHES.clear()
+    submitter.CRASH_LATENCY.reset()
+    yield
+    submitter._CIRCUIT_BREAKERS.clear()
+    submitter._RATE_LIMITERS.clear()
+    submitter._SUBMITTED_CACHES.clear()
+    submitter.CRASH_LATENCY.reset()
 
 
 class LambdaContext:
@@ -72,6 +98,26 @@ class SubmitterClient:
             ]
         }
 
+    def build_sqs_events(self, keys):
+        """Builds an SQS event with one message for each S3 event record
+
+        The message id is the key.
+
+        """
+        if isinstance(keys, str):
+            keys = [keys]
+
+        return {
+            "Records": [
+                {
+                    "eventSource": "aws:sqs",
+                    "messageId": key,
+                    "body": json.dumps(self.build_crash_save_events(key)),
+                }
+                for key in keys
+            ]
+        }
+
     def run(self, events):
         result = handler(events, LambdaContext())
         return result
@@ -98,6 +144,11 @@ class FakeCollector:
         self.payloads = []
 
     def handle_post(self, request, context):
+        # Submitter streams payloads, so read the whole body like a collector
+        # would
+        if request.body is not None and not isinstance(request.body, bytes):
+            request._request.body = b"".join(request.body)
+
         self.payloads.append(request)
         context.status = 200
         # FIXME(willkg): this should return the same crash id that it got--but
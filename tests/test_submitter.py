@@ -2,18 +2,53 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
+from email.header import Header
+import functools
 import gzip
+import json
 import logging
 import random
+import time
 
+from botocore.exceptions import ClientError
 import pytest
+import requests
+import requests_mock
+from requests_mock.exceptions import NoMockAddress
 
+import submitter
 from submitter import (
+    BoundedLogTransport,
+    build_s3_client,
+    CircuitBreaker,
+    CircuitOpenError,
     CONFIG,
+    CRASH_LATENCY,
+    Deadline,
+    Destination,
+    DestinationRateLimitedError,
+    emit_session_pool_stats,
+    encode_field_header,
     extract_crash_id_from_record,
-    get_payload_type,
+    fetch_crash,
+    flush_metrics_and_logs,
+    get_batch_items,
+    get_crash_id_sample,
     get_payload_compressed,
+    get_payload_type,
+    get_s3_client,
+    get_session,
+    METRICS,
+    MetricsAggregator,
+    multipart_encode,
+    MultipartPayload,
+    post_crash,
+    RateLimitedError,
+    RateLimiter,
     remove_collector_keys,
+    S3StreamingObject,
+    StreamFetchError,
+    SubmittedCache,
 )
 
 
@@ -69,6 +104,71 @@ def test_remove_collector_keys(raw_crash, expected):
     assert remove_collector_keys(raw_crash) == expected
 
 
+@pytest.mark.parametrize("payload_compressed", ["0", "1"])
+def test_multipart_encode_streams(payload_compressed):
+    dump = b"abcdef" * 1000
+    payload, headers = multipart_encode(
+        raw_crash={"Product": "Firefox"},
+        dumps={"upload_file_minidump": dump},
+        payload_type="multipart",
+        payload_compressed=payload_compressed,
+    )
+
+    # Content-Length is known up front and the payload can be iterated more than
+    # once
+    body = b"".join(payload)
+    assert len(body) == len(payload) == int(headers["Content-Length"])
+    assert b"".join(payload) == body
+
+    if payload_compressed == "1":
+        body = gzip.decompress(body)
+    else:
+        # The dump is referenced rather than copied
+        assert any(part is dump for part in payload.parts)
+    assert dump in body
+
+
+@pytest.mark.parametrize("key", ["Product", "Ünïcödé", "a" * 100])
+def test_encode_field_header(key):
+    expected = (
+        b"--01659896d5dc42cabd7f3d8a3dcdd3bb\r\n"
+        + (
+            'Content-Disposition: form-data; name="%s"\r\n' % Header(key).encode()
+        ).encode("utf-8")
+        + b"Content-Type: text/plain; charset=utf-8\r\n"
+        + b"\r\n"
+    )
+    assert encode_field_header(key, "text/plain; charset=utf-8") == expected
+
+
+@pytest.mark.parametrize("compression_level", [1, 9])
+def test_multipart_encode_compression(caplog, compression_level):
+    dump = bytes(range(256)) * 1000
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(compression_level=compression_level):
+            payload, headers = multipart_encode(
+                raw_crash={"Product": "Firefox"},
+                dumps={"upload_file_minidump": dump},
+                payload_type="multipart",
+                payload_compressed="1",
+            )
+            METRICS.flush()
+
+    # Payload decompresses and the gzip header records the compression level
+    body = bytes(payload)
+    assert dump in gzip.decompress(body)
+    assert body[8] == (2 if compression_level == 9 else 4)
+
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+    assert any("|gauge|socorro.submitter.payload_bytes.max|" in msg for msg in msgs)
+    assert any(
+        "|%s|gauge|socorro.submitter.compressed_payload_bytes.max|" % len(payload)
+        in msg
+        for msg in msgs
+    )
+    assert any("|count|socorro.submitter.compress_ms.sum|" in msg for msg in msgs)
+
+
 def test_basic(client, caplog, fakes3, mock_collector):
     fakes3.create_bucket()
     fakes3.save_crash(
@@ -166,10 +266,13 @@ def test_multiple_destinations(client, caplog, fakes3, mock_collector):
     # Verify payload was submitted
     #
     # We only have one collector mock, but we can distinguish between the destinations
-    # by looking at the payload request hostname
+    # by looking at the payload request hostname. Destinations are posted to in
+    # parallel, so they can arrive in any order.
     assert len(mock_collector.payloads) == 2
-    assert mock_collector.payloads[0].hostname == "antenna"
-    assert mock_collector.payloads[1].hostname == "antenna_2"
+    assert sorted(req.hostname for req in mock_collector.payloads) == [
+        "antenna",
+        "antenna_2",
+    ]
 
     # The payloads sent to antenna and antenna_2 should be the same
     assert mock_collector.payloads[0].text == mock_collector.payloads[1].text
@@ -483,7 +586,7 @@ def test_throttle_skipped(client, caplog, monkeypatch, fakes3, mock_collector):
     # Verify no payload was submitted
     assert len(mock_collector.payloads) == 0
 
-    assert "|1|count|socorro.submitter.throttled|" in caplog.record_tuples[1][2]
+    assert "|1|count|socorro.submitter.throttled|" in caplog.record_tuples[0][2]
 
 
 def test_different_throttles(client, caplog, monkeypatch, fakes3, mock_collector):
@@ -531,6 +634,90 @@ def test_different_throttles(client, caplog, monkeypatch, fakes3, mock_collector
     assert mock_collector.payloads[0].hostname == "antenna_2"
 
 
+def test_throttle_hash(client, caplog, fakes3, mock_collector):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    sample = get_crash_id_sample(crash_id)
+    assert 0 <= sample < 100
+
+    fakes3.create_bucket()
+    fakes3.save_crash(
+        raw_crash={"uuid": crash_id, "Product": "Firefox", "Version": "60.0"},
+        dumps={"upload_file_minidump": "abcdef"},
+    )
+
+    events = client.build_crash_save_events(client.crash_id_to_key(crash_id))
+
+    # Throttle is just above the crash id sample for the first destination and
+    # at the crash id sample for the second--the decision is the same every time
+    destinations = ",".join(
+        [
+            "http://antenna:8000/submit|%d" % (sample + 1),
+            "http://antenna_2:8000/submit|%d" % sample,
+        ]
+    )
+    # Don't remember submitted crashes so every run makes a throttle decision
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(
+            throttle_mode="hash", destinations=destinations, dedup_cache_size=0
+        ):
+            for _ in range(3):
+                assert client.run(events) is None
+
+    assert len(mock_collector.payloads) == 3
+    assert all(req.hostname == "antenna" for req in mock_collector.payloads)
+
+
+# Crash ids for tests that need several crashes
+CRASH_IDS = [
+    "de1bb258-cbbf-4589-a673-34f800160918",
+    "de1bb258-cbbf-4589-a673-34f801160918",
+    "de1bb258-cbbf-4589-a673-34f802160918",
+]
+
+
+def save_crashes_and_build_events(client, fakes3, crash_ids, saved=None, sqs=False):
+    """Saves crashes to S3 and builds the events for them
+
+    :arg client: the SubmitterClient
+    :arg fakes3: the FakeS3
+    :arg crash_ids: list of crash ids to build events for
+    :arg saved: list of crash ids to save or None to save all of them
+    :arg sqs: whether to wrap the S3 events in SQS messages
+
+    :returns: the events
+
+    """
+    fakes3.create_bucket()
+    for crash_id in crash_ids if saved is None else saved:
+        fakes3.save_crash(
+            raw_crash={"uuid": crash_id, "Product": "Firefox"},
+            dumps={"upload_file_minidump": "abcdef"},
+        )
+
+    keys = [client.crash_id_to_key(crash_id) for crash_id in crash_ids]
+    if sqs:
+        return client.build_sqs_events(keys)
+    return client.build_crash_save_events(keys)
+
+
+def test_throttle_counts_batched(client, caplog, fakes3, mock_collector):
+    events = save_crashes_and_build_events(client, fakes3, CRASH_IDS)
+
+    # Use hash mode so a throttle of 0 always throttles--random mode can roll a 0
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(
+            throttle_mode="hash",
+            destinations="http://antenna:8000/submit|100,http://antenna_2:8000/submit|0",
+        ):
+            assert client.run(events) is None
+
+    # One accept and one throttled line for all the decisions
+    msgs = [msg for _, _, msg in caplog.record_tuples if "MONITORING" in msg]
+    assert "|3|count|socorro.submitter.accept|" in msgs[0]
+    assert "|3|count|socorro.submitter.throttled|" in msgs[1]
+    assert len([msg for msg in msgs if "socorro.submitter.accept" in msg]) == 1
+
+
 def test_user_agent(client, caplog, fakes3, mock_collector):
     user_agent = "crash-reporter/1.0"
 
@@ -594,6 +781,1112 @@ def test_env_tag_added_to_statds_incr(client, caplog, fakes3, mock_collector):
     assert "|1|count|socorro.submitter.accept|#env:stage" in caplog.record_tuples[0][2]
 
 
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_multiple_crashes(client, caplog, fakes3, mock_collector, concurrency):
+    events = save_crashes_and_build_events(client, fakes3, CRASH_IDS)
+
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(
+            concurrency=concurrency, destinations="http://antenna:8000/submit|100"
+        ):
+            assert client.run(events) is None
+
+    # Verify all crashes were submitted
+    assert len(mock_collector.payloads) == 3
+    submitted = sorted(
+        crash_id
+        for crash_id in CRASH_IDS
+        for req in mock_collector.payloads
+        if crash_id in req.text
+    )
+    assert submitted == CRASH_IDS
+
+
+def test_concurrency_error_doesnt_stop_other_crashes(
+    client, caplog, fakes3, mock_collector
+):
+    # Only save the second crash so fetching the first one fails
+    events = save_crashes_and_build_events(
+        client, fakes3, CRASH_IDS[:2], saved=CRASH_IDS[1:2]
+    )
+
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(
+            concurrency=2, destinations="http://antenna:8000/submit|100"
+        ):
+            with pytest.raises(ClientError):
+                client.run(events)
+
+    # The second crash was still submitted and the error was counted
+    assert len(mock_collector.payloads) == 1
+    assert CRASH_IDS[1] in mock_collector.payloads[0].text
+    assert any(
+        "|1|count|socorro.submitter.unknown_s3fetch_error|" in msg
+        for _, _, msg in caplog.record_tuples
+    )
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_partial_batch_failures(client, caplog, fakes3, mock_collector, concurrency):
+    # Don't save the first crash so fetching it fails
+    events = save_crashes_and_build_events(
+        client, fakes3, CRASH_IDS, saved=CRASH_IDS[1:], sqs=True
+    )
+
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(
+            concurrency=concurrency,
+            partial_batch_failures=True,
+            destinations="http://antenna:8000/submit|100",
+        ):
+            result = client.run(events)
+
+    # Only the message with the crash that failed is reported and the others
+    # were submitted
+    key = client.crash_id_to_key(CRASH_IDS[0])
+    assert result == {"batchItemFailures": [{"itemIdentifier": key}]}
+    assert len(mock_collector.payloads) == 2
+    assert any(
+        "|1|count|socorro.submitter.crash_failed|" in msg
+        for _, _, msg in caplog.record_tuples
+    )
+
+
+def test_partial_batch_failures_s3_event(client, fakes3, mock_collector):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    fakes3.create_bucket()
+
+    # Lambda ignores the response for S3 notifications, so crashes that fail
+    # raise an error even with partial batch failures
+    events = client.build_crash_save_events(client.crash_id_to_key(crash_id))
+    with CONFIG.override(
+        partial_batch_failures=True, destinations="http://antenna:8000/submit|100"
+    ):
+        with pytest.raises(ClientError):
+            client.run(events)
+
+
+def test_get_batch_items(client):
+    keys = [client.crash_id_to_key(crash_id) for crash_id in CRASH_IDS]
+
+    events = client.build_crash_save_events(keys)
+    assert get_batch_items(events) == [(crash_id, None) for crash_id in CRASH_IDS]
+
+    events = client.build_sqs_events(keys)
+    assert get_batch_items(events) == list(zip(CRASH_IDS, keys))
+
+
+@pytest.mark.parametrize("dump_fetch_concurrency", [1, 4])
+def test_fetch_dumps(fakes3, dump_fetch_concurrency):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    dumps = {
+        "upload_file_minidump": "abcdef",
+        "upload_file_minidump_browser": "abcdef2",
+        "memory_report": "abcdef3",
+    }
+    fakes3.create_bucket()
+    fakes3.save_crash(raw_crash={"uuid": crash_id}, dumps=dumps)
+
+    client = build_s3_client("foo", "foo")
+    with CONFIG.override(dump_fetch_concurrency=dump_fetch_concurrency):
+        raw_crash, fetched = fetch_crash(client, CONFIG.s3_bucket, crash_id)
+
+    assert raw_crash == {"uuid": crash_id}
+    assert fetched == {name: data.encode("utf-8") for name, data in dumps.items()}
+
+
+def test_crash_too_large(client, caplog, fakes3, mock_collector):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    fakes3.create_bucket()
+    fakes3.save_crash(
+        raw_crash={"uuid": crash_id, "Product": "Firefox", "Version": "60.0"},
+        dumps={"upload_file_minidump": "a" * 1000},
+    )
+
+    events = client.build_crash_save_events(client.crash_id_to_key(crash_id))
+
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(
+            max_crash_size=500, destinations="http://antenna:8000/submit|100"
+        ):
+            assert client.run(events) is None
+
+    # Verify crash was skipped and that was counted
+    assert len(mock_collector.payloads) == 0
+    assert any(
+        "|1|count|socorro.submitter.crash_too_large|" in msg
+        for _, _, msg in caplog.record_tuples
+    )
+
+
+def test_get_s3_client(fakes3):
+    client = get_s3_client()
+    assert get_s3_client() is client
+    assert client.meta.config.max_pool_connections == 10
+
+    # Changing configuration gets a different client
+    with CONFIG.override(s3_endpoint_url="http://localstack:4566"):
+        client_2 = get_s3_client()
+    assert client_2 is not client
+    assert client_2.meta.endpoint_url == "http://localstack:4566"
+
+    # Pool size is big enough for the configured concurrency
+    with CONFIG.override(concurrency=4, dump_fetch_concurrency=4):
+        assert get_s3_client().meta.config.max_pool_connections == 20
+    with CONFIG.override(s3_max_pool_connections=50):
+        assert get_s3_client().meta.config.max_pool_connections == 50
+
+
+def test_get_session():
+    session = get_session("http://antenna:8000/submit")
+
+    # Same destination reuses the session, different destination doesn't
+    assert get_session("http://antenna:8000/submit") is session
+    assert get_session("http://antenna_2:8000/submit") is not session
+
+    # Changing pool size creates a new session with the new pool size
+    with CONFIG.override(http_pool_size=2):
+        session_2 = get_session("http://antenna:8000/submit")
+    assert session_2 is not session
+    assert session_2.get_adapter("http://antenna:8000")._pool_maxsize == 2
+
+
+def test_emit_session_pool_stats(caplog, monkeypatch):
+    stats = {"connections": 0, "requests": 0}
+
+    def fake_pool_stats(session):
+        return stats["connections"], stats["requests"]
+
+    monkeypatch.setattr(submitter, "get_session_pool_stats", fake_pool_stats)
+    monkeypatch.setattr(submitter, "_SESSIONS", {})
+    monkeypatch.setattr(submitter, "_SESSION_STATS", {})
+    get_session("http://antenna:8000/submit")
+
+    # 1 connection created and used for 3 requests
+    stats.update(connections=1, requests=3)
+    with caplog.at_level(logging.INFO):
+        emit_session_pool_stats()
+        METRICS.flush()
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+    assert "|1|count|socorro.submitter.http_connection_created|" in msgs[0]
+    assert "|2|count|socorro.submitter.http_connection_reused|" in msgs[1]
+
+    # Only the difference since last time gets emitted
+    caplog.clear()
+    stats.update(connections=1, requests=4)
+    with caplog.at_level(logging.INFO):
+        emit_session_pool_stats()
+        METRICS.flush()
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+    assert len(msgs) == 1
+    assert "|1|count|socorro.submitter.http_connection_reused|" in msgs[0]
+
+
+@pytest.mark.parametrize("payload_compressed", ["0", "1"])
+def test_stream_dumps(client, caplog, fakes3, mock_collector, payload_compressed):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    dump = "abcdef" * 50000
+    fakes3.create_bucket()
+    fakes3.save_crash(
+        raw_crash={
+            "uuid": crash_id,
+            "Product": "Firefox",
+            "metadata": {"payload_compressed": payload_compressed},
+        },
+        dumps={"upload_file_minidump": dump},
+    )
+
+    events = client.build_crash_save_events(client.crash_id_to_key(crash_id))
+
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(
+            stream_dumps=True,
+            destinations="http://antenna:8000/submit|100,http://antenna_2:8000/submit|100",
+        ):
+            assert client.run(events) is None
+
+    # Verify the dump was streamed to both destinations with the right length
+    assert len(mock_collector.payloads) == 2
+    for req in mock_collector.payloads:
+        assert len(req.body) == int(req.headers["Content-Length"])
+        body = req.body
+        if payload_compressed == "1":
+            body = gzip.decompress(body)
+        assert dump.encode("utf-8") in body
+
+
+class FailingS3Client:
+    def get_object(self, Bucket, Key):
+        raise ClientError({"Error": {"Code": "InternalError"}}, "GetObject")
+
+
+def test_stream_fetch_error(caplog, mock_collector):
+    destination = Destination(
+        url="http://antenna:8000/submit", throttle=100, connect_timeout=5, timeout=30
+    )
+    payload = MultipartPayload(
+        [b"abc", S3StreamingObject(FailingS3Client(), "bucket", "key", size=10)]
+    )
+
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(circuit_breaker_threshold=1):
+            with pytest.raises(StreamFetchError):
+                post_crash("crash_id", destination, payload, headers={})
+            METRICS.flush()
+
+    # S3 errors don't count against the destination
+    assert submitter.get_circuit_breaker(destination.url).allow()
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+    assert any("|1|count|socorro.submitter.stream_fetch_error|" in msg for msg in msgs)
+    assert not any("socorro.submitter.unknown_httppost_error" in msg for msg in msgs)
+
+
+def test_phase_timings(client, caplog, fakes3, mock_collector):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    fakes3.create_bucket()
+    fakes3.save_crash(
+        raw_crash={
+            "uuid": crash_id,
+            "Product": "Firefox",
+            "metadata": {"payload": "multipart", "payload_compressed": "1"},
+        },
+        dumps={"upload_file_minidump": "abcdef"},
+    )
+
+    events = client.build_crash_save_events(client.crash_id_to_key(crash_id))
+
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(
+            log_crash_timings=True,
+            destinations="http://antenna:8000/submit|100,http://antenna_2:8000/submit|100",
+        ):
+            assert client.run(events) is None
+
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+
+    # Phase timings are tagged with the payload type
+    payload_tags = "#env:test,payload_type:multipart,payload_compressed:1"
+    for phase in ("fetch_raw_crash", "fetch_dumps", "encode", "compress"):
+        key = "|gauge|socorro.submitter.%s_ms.max|%s" % (phase, payload_tags)
+        assert any(msg.endswith(key) for msg in msgs)
+
+    # POST timings are also tagged with the destination
+    for destination in ("antenna:8000", "antenna_2:8000"):
+        key = "|count|socorro.submitter.post_ms.count|%s,destination:%s" % (
+            payload_tags,
+            destination,
+        )
+        assert any(msg.endswith(key) for msg in msgs)
+
+    # One line summarizes the crash
+    records = [
+        record for record in caplog.records if record.msg.startswith("crash timings")
+    ]
+    assert len(records) == 1
+    assert records[0].crash_id == crash_id
+    assert sorted(records[0].timings) == [
+        "compress",
+        "encode",
+        "fetch_dumps",
+        "fetch_raw_crash",
+        "post:antenna:8000",
+        "post:antenna_2:8000",
+    ]
+    assert records[0].timings["fetch_dumps"]["bytes"] == len("abcdef")
+
+
+def test_destination_failure_doesnt_stop_other_destinations(
+    client, caplog, fakes3, mock_collector
+):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    fakes3.create_bucket()
+    fakes3.save_crash(
+        raw_crash={"uuid": crash_id, "Product": "Firefox"},
+        dumps={"upload_file_minidump": "abcdef"},
+    )
+
+    events = client.build_crash_save_events(client.crash_id_to_key(crash_id))
+
+    # antenna_3 isn't set up in the collector mock, so posting to it fails
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(
+            http_connect_timeout=5.0,
+            http_timeout=30.0,
+            destinations=(
+                "http://antenna_3:8000/submit|100,"
+                + "http://antenna:8000/submit|100|timeout=2.5"
+            ),
+        ):
+            with pytest.raises(NoMockAddress):
+                client.run(events)
+
+    # The payload was still posted to antenna with its timeout
+    assert len(mock_collector.payloads) == 1
+    assert mock_collector.payloads[0].hostname == "antenna"
+    assert mock_collector.payloads[0].timeout == (5.0, 2.5)
+
+    # The error is counted for the destination that failed
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+    assert any(
+        "|1|count|socorro.submitter.unknown_httppost_error|" in msg
+        and msg.endswith("destination:antenna_3:8000")
+        for msg in msgs
+    )
+
+
+def test_get_destinations():
+    with CONFIG.override(
+        http_connect_timeout=5.0,
+        http_timeout=30.0,
+        destinations=(
+            "http://antenna:8000/submit|20,"
+            + "http://antenna_2:8000/submit|100|connect_timeout=1|timeout=10"
+        ),
+    ):
+        assert CONFIG.get_destinations() == [
+            Destination(
+                url="http://antenna:8000/submit",
+                throttle=20,
+                connect_timeout=5.0,
+                timeout=30.0,
+            ),
+            Destination(
+                url="http://antenna_2:8000/submit",
+                throttle=100,
+                connect_timeout=1.0,
+                timeout=10.0,
+            ),
+        ]
+
+    with CONFIG.override(destinations="http://antenna:8000/submit|20|foo=1"):
+        with pytest.raises(ValueError):
+            CONFIG.get_destinations()
+
+
+def test_payload_variants(client, caplog, monkeypatch, fakes3, mock_collector):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    fakes3.create_bucket()
+    fakes3.save_crash(
+        raw_crash={
+            "uuid": crash_id,
+            "Product": "Firefox",
+            "metadata": {"payload": "multipart", "payload_compressed": "0"},
+        },
+        dumps={"upload_file_minidump": "abcdef"},
+    )
+    events = client.build_crash_save_events(client.crash_id_to_key(crash_id))
+
+    encoded = []
+
+    def counting_multipart_encode(**kwargs):
+        encoded.append(kwargs["payload_type"])
+        return multipart_encode(**kwargs)
+
+    monkeypatch.setattr(submitter, "multipart_encode", counting_multipart_encode)
+
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(
+            destinations=(
+                "http://antenna:8000/submit|100,"
+                + "http://antenna_2:8000/submit|100|payload_type=json|payload_compressed=1,"
+                + "http://antenna_2:8000/submit|100|payload_type=json"
+            ),
+        ):
+            assert client.run(events) is None
+
+    # Each payload type was only encoded once even though two destinations use
+    # json
+    assert sorted(encoded) == ["json", "multipart"]
+
+    assert len(mock_collector.payloads) == 3
+    by_host = {}
+    for req in mock_collector.payloads:
+        by_host.setdefault(req.hostname, []).append(req)
+
+    # antenna gets the crash the way it was submitted
+    [req] = by_host["antenna"]
+    assert "Content-Encoding" not in req.headers
+    assert b'name="Product"' in req.body
+
+    # antenna_2 gets annotations as json, once compressed and once not
+    bodies = []
+    for req in by_host["antenna_2"]:
+        body = req.body
+        if req.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        bodies.append(body)
+        assert req.headers["User-Agent"] == "socorro-submitter/1.0"
+    assert bodies[0] == bodies[1]
+    assert b'name="extra"' in bodies[0]
+
+    # Post metrics are tagged with the variant the destination got
+    assert any(
+        "|count|socorro.submitter.post_ms.count|" in msg
+        and "payload_type:json,payload_compressed:1,destination:antenna_2:8000" in msg
+        for _, _, msg in caplog.record_tuples
+    )
+
+
+def test_get_destinations_payload_options():
+    with CONFIG.override(
+        destinations="http://antenna:8000/submit|20|payload_type=json|payload_compressed=0"
+    ):
+        [destination] = CONFIG.get_destinations()
+        assert destination.payload_type == "json"
+        assert destination.payload_compressed == "0"
+
+    with CONFIG.override(destinations="http://antenna:8000/submit|20|payload_type=xml"):
+        with pytest.raises(ValueError):
+            CONFIG.get_destinations()
+
+
+def test_post_retries(client, caplog, fakes3, mock_collector):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    events = save_crashes_and_build_events(client, fakes3, [crash_id])
+
+    with requests_mock.mock() as rm:
+        rm.post(
+            "http://antenna:8000/submit",
+            [
+                {"status_code": 503},
+                {"exc": requests.exceptions.ConnectionError},
+                {"status_code": 200, "text": "CrashID=bp-xxx"},
+            ],
+        )
+        with caplog.at_level(logging.INFO):
+            with CONFIG.override(
+                http_retries=2,
+                http_retry_backoff=0.0,
+                destinations="http://antenna:8000/submit|100",
+            ):
+                assert client.run(events) is None
+
+    assert rm.call_count == 3
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+    assert any("|2|count|socorro.submitter.httppost_retry|" in msg for msg in msgs)
+    assert any(
+        "|1|count|socorro.submitter.httppost_status|" in msg
+        and msg.endswith("status:200")
+        for msg in msgs
+    )
+
+
+def test_post_retries_exhausted(client, caplog, fakes3, mock_collector):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    events = save_crashes_and_build_events(client, fakes3, [crash_id])
+
+    with requests_mock.mock() as rm:
+        rm.post("http://antenna:8000/submit", status_code=500)
+        with caplog.at_level(logging.INFO):
+            with CONFIG.override(
+                http_retries=1,
+                http_retry_backoff=0.0,
+                destinations="http://antenna:8000/submit|100",
+            ):
+                with pytest.raises(requests.exceptions.HTTPError):
+                    client.run(events)
+
+    assert rm.call_count == 2
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+    assert any(
+        "|1|count|socorro.submitter.unknown_httppost_error|" in msg for msg in msgs
+    )
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, window=60, cooldown=60)
+    assert breaker.allow() is True
+    assert breaker.record_failure() is False
+    assert breaker.allow() is True
+    assert breaker.record_failure() is True
+    assert breaker.allow() is False
+
+    # With no cooldown, one trial post is allowed at a time and success closes
+    # the breaker
+    breaker = CircuitBreaker(failure_threshold=1, window=60, cooldown=0)
+    assert breaker.record_failure() is True
+    assert breaker.allow() is True
+    assert breaker.allow() is False
+    breaker.record_success()
+    assert breaker.allow() is True
+    assert breaker.allow() is True
+
+    # A threshold of 0 never opens
+    breaker = CircuitBreaker(failure_threshold=0, window=60, cooldown=60)
+    for _ in range(10):
+        assert breaker.record_failure() is False
+    assert breaker.allow() is True
+
+
+def test_circuit_breaker_stops_posts(client, caplog, fakes3, mock_collector):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    events = save_crashes_and_build_events(client, fakes3, [crash_id])
+
+    with requests_mock.mock() as rm:
+        rm.post("http://antenna:8000/submit", status_code=503)
+        with caplog.at_level(logging.INFO):
+            with CONFIG.override(
+                http_retries=0,
+                circuit_breaker_threshold=1,
+                destinations="http://antenna:8000/submit|100",
+            ):
+                with pytest.raises(requests.exceptions.HTTPError):
+                    client.run(events)
+                assert rm.call_count == 1
+
+                # The breaker is open, so the crash isn't posted
+                with pytest.raises(CircuitOpenError):
+                    client.run(events)
+                assert rm.call_count == 1
+
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+    assert any("|1|count|socorro.submitter.circuit_opened|" in msg for msg in msgs)
+    assert any("|1|count|socorro.submitter.circuit_open|" in msg for msg in msgs)
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(rate=2, byte_rate=0)
+
+    # The bucket starts with a second's worth of crashes
+    assert limiter.acquire(100, max_wait=0) == 0
+    assert limiter.acquire(100, max_wait=0) == 0
+
+    # The next one has to wait about half a second
+    assert limiter.acquire(100, max_wait=0) is None
+    assert 0.4 < limiter.acquire(100, max_wait=10) <= 0.5
+
+    # Bytes are limited too and big payloads are allowed but make later posts
+    # wait
+    limiter = RateLimiter(rate=0, byte_rate=1000)
+    assert limiter.acquire(5000, max_wait=0) == 0
+    # The bucket had 1000 bytes, so it's 4000 bytes in debt
+    assert 3.9 < limiter.acquire(10, max_wait=10) <= 4.01
+
+    # Pausing makes everything wait
+    limiter = RateLimiter(rate=0, byte_rate=0)
+    assert limiter.acquire(10, max_wait=0) == 0
+    limiter.pause(30)
+    assert limiter.acquire(10, max_wait=10) is None
+    assert 29 < limiter.acquire(10, max_wait=60) <= 30
+
+
+@pytest.mark.parametrize("retry_after", ["0", "Thu, 01 Jan 1970 00:00:00 GMT"])
+def test_retry_after(client, caplog, fakes3, mock_collector, retry_after):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    events = save_crashes_and_build_events(client, fakes3, [crash_id])
+
+    with requests_mock.mock() as rm:
+        rm.post(
+            "http://antenna:8000/submit",
+            [
+                {"status_code": 429, "headers": {"Retry-After": retry_after}},
+                {"status_code": 200, "text": "CrashID=bp-xxx"},
+            ],
+        )
+        with caplog.at_level(logging.INFO):
+            with CONFIG.override(
+                http_retries=1,
+                http_retry_backoff=0.0,
+                destinations="http://antenna:8000/submit|100",
+            ):
+                assert client.run(events) is None
+
+    assert rm.call_count == 2
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+    assert any("|1|count|socorro.submitter.retry_after|" in msg for msg in msgs)
+
+
+def test_retry_after_only_applies_to_next_retry(
+    client, monkeypatch, fakes3, mock_collector
+):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    events = save_crashes_and_build_events(client, fakes3, [crash_id])
+
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+
+    with requests_mock.mock() as rm:
+        rm.post(
+            "http://antenna:8000/submit",
+            [
+                {"status_code": 503, "headers": {"Retry-After": "5"}},
+                {"status_code": 500},
+                {"status_code": 200, "text": "CrashID=bp-xxx"},
+            ],
+        )
+        with CONFIG.override(
+            http_retries=2,
+            http_retry_backoff=0.0,
+            destinations="http://antenna:8000/submit|100",
+        ):
+            assert client.run(events) is None
+
+    # The retry after the 500 doesn't wait for the earlier Retry-After
+    assert rm.call_count == 3
+    assert sleeps == [5, 0]
+
+
+def test_retry_after_too_long(client, caplog, fakes3, mock_collector):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    events = save_crashes_and_build_events(client, fakes3, [crash_id])
+
+    with requests_mock.mock() as rm:
+        rm.post(
+            "http://antenna:8000/submit",
+            status_code=503,
+            headers={"Retry-After": "120"},
+        )
+        with caplog.at_level(logging.INFO):
+            with CONFIG.override(
+                http_retries=2,
+                rate_limit_max_delay=10.0,
+                destinations="http://antenna:8000/submit|100",
+            ):
+                # The collector asked to wait longer than the maximum delay, so
+                # the post isn't retried and the crash fails
+                with pytest.raises(DestinationRateLimitedError):
+                    client.run(events)
+                assert rm.call_count == 1
+
+                # Posts to the destination are paused, so the crash isn't
+                # posted
+                with pytest.raises(RateLimitedError):
+                    client.run(events)
+                assert rm.call_count == 1
+
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+    assert any("|1|count|socorro.submitter.rate_limit_rejected|" in msg for msg in msgs)
+    assert any("|1|count|socorro.submitter.rate_limit_exceeded|" in msg for msg in msgs)
+
+
+def test_rate_limited_by_destination_doesnt_open_breaker(
+    client, caplog, fakes3, mock_collector
+):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    events = save_crashes_and_build_events(client, fakes3, [crash_id])
+
+    with requests_mock.mock() as rm:
+        rm.post("http://antenna:8000/submit", status_code=429)
+        with caplog.at_level(logging.INFO):
+            with CONFIG.override(
+                http_retries=0,
+                circuit_breaker_threshold=1,
+                destinations="http://antenna:8000/submit|100",
+            ):
+                for _ in range(3):
+                    with pytest.raises(DestinationRateLimitedError):
+                        client.run(events)
+
+    # Every crash was posted--the breaker never opened
+    assert rm.call_count == 3
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+    assert not any("socorro.submitter.circuit_opened" in msg for msg in msgs)
+    assert not any("socorro.submitter.unknown_httppost_error" in msg for msg in msgs)
+
+
+def test_rate_limit_shed(client, caplog, fakes3, mock_collector):
+    events = save_crashes_and_build_events(client, fakes3, CRASH_IDS)
+
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(
+            destinations=(
+                "http://antenna:8000/submit|100|rate=0.01|rate_limit_policy=shed,"
+                + "http://antenna_2:8000/submit|100"
+            ),
+        ):
+            assert client.run(events) is None
+
+    # antenna only gets one crash and the rest are dropped, but antenna_2 gets
+    # them all
+    hosts = sorted(req.hostname for req in mock_collector.payloads)
+    assert hosts == ["antenna", "antenna_2", "antenna_2", "antenna_2"]
+    assert any(
+        "|2|count|socorro.submitter.rate_limit_dropped|" in msg
+        for _, _, msg in caplog.record_tuples
+    )
+
+
+def test_dedup(client, caplog, fakes3, mock_collector):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    fakes3.create_bucket()
+    fakes3.save_crash(
+        raw_crash={"uuid": crash_id, "Product": "Firefox", "Version": "60.0"},
+        dumps={"upload_file_minidump": "abcdef"},
+    )
+
+    # The crash id is in the batch twice, but only gets submitted once
+    key = client.crash_id_to_key(crash_id)
+    events = client.build_crash_save_events([key, key])
+    destinations = "http://antenna:8000/submit|100"
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(destinations=destinations):
+            assert client.run(events) is None
+
+    assert len(mock_collector.payloads) == 1
+    assert any(
+        "|1|count|socorro.submitter.duplicate_record|" in msg
+        for _, _, msg in caplog.record_tuples
+    )
+    assert any(
+        "|1|count|socorro.submitter.dedup_miss|" in msg
+        for _, _, msg in caplog.record_tuples
+    )
+
+    # Running it again skips it without fetching it
+    caplog.clear()
+    mock_collector.clear()
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(destinations=destinations):
+            assert client.run(events) is None
+
+    assert len(mock_collector.payloads) == 0
+    assert any(
+        "|1|count|socorro.submitter.dedup_hit|" in msg
+        for _, _, msg in caplog.record_tuples
+    )
+    assert not any(
+        "socorro.submitter.fetch_raw_crash_ms" in msg
+        for _, _, msg in caplog.record_tuples
+    )
+
+
+def test_dedup_only_remembers_successes(client, fakes3, mock_collector):
+    crash_id = "de1bb258-cbbf-4589-a673-34f800160918"
+    fakes3.create_bucket()
+    fakes3.save_crash(
+        raw_crash={"uuid": crash_id, "Product": "Firefox", "Version": "60.0"},
+        dumps={"upload_file_minidump": "abcdef"},
+    )
+    events = client.build_crash_save_events(client.crash_id_to_key(crash_id))
+
+    # antenna_2 fails, so the redelivered crash only goes to antenna_2
+    destinations = "http://antenna:8000/submit|100,http://antenna_2:8000/submit|100"
+    with CONFIG.override(destinations=destinations, http_retries=0):
+        mock_collector.clear()
+        with requests_mock.mock() as rm:
+            rm.post("//antenna:8000/submit", text=mock_collector.handle_post)
+            rm.post("//antenna_2:8000/submit", status_code=500)
+            with pytest.raises(requests.exceptions.HTTPError):
+                client.run(events)
+
+        assert [req.hostname for req in mock_collector.payloads] == ["antenna"]
+
+        mock_collector.clear()
+        assert client.run(events) is None
+        assert [req.hostname for req in mock_collector.payloads] == ["antenna_2"]
+
+
+def test_submitted_cache(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+
+    cache = SubmittedCache(max_size=2, ttl=10)
+    cache.add(("a", "url"))
+    cache.add(("b", "url"))
+    assert ("a", "url") in cache
+
+    # Adding a third evicts the least recently used one
+    cache.add(("c", "url"))
+    assert ("b", "url") not in cache
+    assert ("a", "url") in cache
+    assert ("c", "url") in cache
+
+    # Entries expire
+    now[0] = 110.0
+    assert ("a", "url") not in cache
+
+    # A size of 0 remembers nothing
+    cache = SubmittedCache(max_size=0, ttl=10)
+    cache.add(("a", "url"))
+    assert ("a", "url") not in cache
+
+
+def test_deadline():
+    class Context:
+        remaining = 10000
+
+        def get_remaining_time_in_millis(self):
+            return self.remaining
+
+    context = Context()
+    deadline = Deadline(context, margin=2)
+    assert deadline.can_start()
+
+    # Crashes take 5 seconds, so there's time for one when 8 seconds are left
+    CRASH_LATENCY.add(5)
+    assert deadline.can_start()
+
+    context.remaining = 6000
+    assert not deadline.can_start()
+
+    # No context means no deadline
+    assert Deadline(None, margin=2).can_start()
+
+
+def test_deadline_skips_crashes(client, caplog, fakes3, mock_collector):
+    events = save_crashes_and_build_events(client, fakes3, CRASH_IDS[:2], sqs=True)
+    keys = [record["messageId"] for record in events["Records"]]
+
+    # The test context has 5 seconds left and crashes take 2 seconds, so
+    # nothing gets started with a 4 second margin
+    CRASH_LATENCY.add(2)
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(
+            destinations="http://antenna:8000/submit|100",
+            deadline_margin=4,
+            partial_batch_failures=True,
+        ):
+            result = client.run(events)
+
+    assert result == {"batchItemFailures": [{"itemIdentifier": key} for key in keys]}
+    assert len(mock_collector.payloads) == 0
+    assert any(
+        "|2|count|socorro.submitter.deadline_skipped|" in msg
+        for _, _, msg in caplog.record_tuples
+    )
+
+    # With enough time, they're processed
+    with CONFIG.override(destinations="http://antenna:8000/submit|100"):
+        assert client.run(events) is None
+    assert len(mock_collector.payloads) == 2
+
+
+def test_main_file(tmp_path, capsys, client, fakes3, mock_collector):
+    crash_ids = CRASH_IDS
+
+    # Don't save the last crash so it fails
+    save_crashes_and_build_events(client, fakes3, crash_ids, saved=crash_ids[:2])
+
+    # The first crash is listed twice, but only submitted once
+    path = tmp_path / "crashids.txt"
+    path.write_text(
+        "# crashes to backfill\n" + "\n".join(crash_ids + crash_ids[:1]) + "\n\n"
+    )
+
+    # Ignore output from setting up S3
+    capsys.readouterr()
+
+    with CONFIG.override(destinations="http://antenna:8000/submit|0"):
+        ret = submitter.main(
+            [
+                "--file",
+                str(path),
+                "--workers",
+                "2",
+                "--rate",
+                "100",
+                "--ignore-throttle",
+            ]
+        )
+
+    assert ret == 1
+    assert len(mock_collector.payloads) == 2
+
+    report = json.loads(capsys.readouterr().out)
+    assert report["attempted"] == 3
+    assert report["succeeded"] == 2
+    assert report["skipped"] == 1
+    assert report["failed_crash_ids"] == [crash_ids[2]]
+    assert set(report["latency_ms"]) == {"p50", "p95", "p99", "max"}
+
+    # Running it again only retries the crash that failed
+    mock_collector.clear()
+    with CONFIG.override(destinations="http://antenna:8000/submit|0"):
+        report = submitter.backfill(crash_ids, workers=1, rate=0, ignore_throttle=True)
+    assert report["attempted"] == 1
+    assert report["failed_crash_ids"] == [crash_ids[2]]
+    assert len(mock_collector.payloads) == 0
+
+
+def test_main_s3_prefix(capsys, client, fakes3, mock_collector):
+    # The last crash is from a different day, so it's not under the prefix
+    crash_ids = CRASH_IDS[:2] + ["de1bb258-cbbf-4589-a673-34f802160919"]
+    save_crashes_and_build_events(client, fakes3, crash_ids)
+
+    # Ignore output from setting up S3
+    capsys.readouterr()
+
+    with CONFIG.override(destinations="http://antenna:8000/submit|100"):
+        ret = submitter.main(["--s3-prefix", "v1/raw_crash/20160918/"])
+
+    assert ret == 0
+    assert len(mock_collector.payloads) == 2
+    report = json.loads(capsys.readouterr().out)
+    assert report["attempted"] == 2
+    assert report["succeeded"] == 2
+    assert report["failed"] == 0
+
+
+def test_backfill_pacing_after_stall(monkeypatch, fakes3):
+    crash_ids = ["de1bb258-cbbf-4589-a673-34f80%d160918" % i for i in range(6)]
+    starts = []
+
+    def fake_process_crash(client, crash_id, destinations):
+        starts.append(time.monotonic())
+        # The first crash holds up the only worker for several intervals
+        if crash_id == crash_ids[0]:
+            time.sleep(0.3)
+
+    monkeypatch.setattr(submitter, "process_crash", fake_process_crash)
+
+    with CONFIG.override(destinations="http://antenna:8000/submit|100"):
+        report = submitter.backfill(crash_ids, workers=1, rate=20)
+
+    assert report["attempted"] == 6
+    # Crashes that were held up still start at most 20 per second rather than
+    # all at once
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    assert all(gap >= 0.04 for gap in gaps[1:])
+
+
+def test_metrics_aggregator(caplog):
+    with caplog.at_level(logging.INFO):
+        metrics = MetricsAggregator()
+        metrics.incr("socorro.submitter.accept")
+        metrics.incr("socorro.submitter.accept", value=2)
+        metrics.histogram("socorro.submitter.payload_bytes", 10)
+        metrics.histogram("socorro.submitter.payload_bytes", 30)
+
+        # Nothing is emitted until the metrics are flushed
+        assert caplog.record_tuples == []
+        metrics.flush()
+
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+    assert len(msgs) == 4
+    assert "|3|count|socorro.submitter.accept|" in msgs[0]
+    assert "|2|count|socorro.submitter.payload_bytes.count|" in msgs[1]
+    assert "|40|count|socorro.submitter.payload_bytes.sum|" in msgs[2]
+    assert "|30|gauge|socorro.submitter.payload_bytes.max|" in msgs[3]
+
+    # Flushing resets
+    caplog.clear()
+    metrics.flush()
+    assert caplog.record_tuples == []
+
+
+def test_metrics_aggregator_flush_interval(caplog):
+    with caplog.at_level(logging.INFO):
+        with CONFIG.override(metrics_flush_interval=0.001):
+            metrics = MetricsAggregator()
+            metrics.last_flush -= 1
+            metrics.incr("socorro.submitter.accept")
+
+    msgs = [msg for _, _, msg in caplog.record_tuples]
+    assert "|1|count|socorro.submitter.accept|" in msgs[0]
+
+
+class FakeCloudLoggingClient:
+    """Fakes the parts of the Cloud Logging client the transports use"""
+
+    project = "test"
+
+    def __init__(self):
+        self.entries = []
+
+    def logger(self, name, resource=None):
+        return self
+
+    def batch(self):
+        return FakeCloudLoggingBatch(self)
+
+
+class FakeCloudLoggingBatch:
+    def __init__(self, client):
+        self.client = client
+        self.entries = []
+
+    def log(self, **kwargs):
+        self.entries.append(kwargs)
+
+    def commit(self):
+        # Like the real batch, committing clears the entries
+        self.client.entries.extend(self.entries)
+        del self.entries[:]
+
+
+def test_bounded_log_transport():
+    client = FakeCloudLoggingClient()
+    transport = BoundedLogTransport(client, "test", max_queue_size=100)
+    for i in range(10):
+        record = logging.LogRecord("submitter", logging.INFO, "", 0, "", (), None)
+        transport.send(record, "message %d" % i)
+
+    # Flush blocks until everything is sent
+    transport.flush()
+    assert [entry["message"] for entry in client.entries] == [
+        "message %d" % i for i in range(10)
+    ]
+    assert transport.pop_dropped() == 0
+
+
+def test_bounded_log_transport_counts_sent_records():
+    client = FakeCloudLoggingClient()
+    transport = BoundedLogTransport(client, "test", max_queue_size=10)
+    record = logging.LogRecord("submitter", logging.INFO, "", 0, "", (), None)
+    for i in range(10):
+        transport.send(record, "message %d" % i)
+
+    # Once the worker has sent them, there's room for more
+    transport.flush()
+    assert transport.pending() == 0
+    for i in range(5):
+        transport.send(record, "message %d" % i)
+    transport.flush()
+
+    assert len(client.entries) == 15
+    assert transport.pop_dropped() == 0
+
+
+def test_flush_metrics_and_logs_flushes_transport(monkeypatch):
+    from google.cloud.logging_v2.handlers import CloudLoggingHandler
+    from google.cloud.logging_v2.resource import Resource
+
+    monkeypatch.setattr(submitter, "_LOG_TRANSPORTS", [])
+
+    client = FakeCloudLoggingClient()
+    handler = CloudLoggingHandler(
+        client=client,
+        name="test",
+        transport=functools.partial(BoundedLogTransport, max_queue_size=100),
+        resource=Resource(type="global", labels={}),
+    )
+    transport = handler.transport
+    flush_calls = []
+    original_flush = transport.transport.flush
+    monkeypatch.setattr(
+        transport.transport,
+        "flush",
+        lambda: flush_calls.append(1) or original_flush(),
+    )
+
+    logger = logging.getLogger("submitter.test_flush")
+    logger.addHandler(handler)
+    try:
+        logger.warning("message")
+        flush_metrics_and_logs()
+    finally:
+        logger.removeHandler(handler)
+
+    assert flush_calls == [1]
+    assert transport.pending() == 0
+    assert [entry["message"] for entry in client.entries] == ["message"]
+
+
+def test_bounded_log_transport_drops_when_full(monkeypatch):
+    client = FakeCloudLoggingClient()
+    transport = BoundedLogTransport(client, "test", max_queue_size=5)
+    monkeypatch.setattr(transport, "pending", lambda: 5)
+
+    record = logging.LogRecord("submitter", logging.INFO, "", 0, "", (), None)
+    transport.send(record, "message")
+    transport.send(record, "message")
+    transport.flush()
+
+    assert client.entries == []
+    assert transport.pop_dropped() == 2
+    assert transport.pop_dropped() == 0
+
+
 @pytest.mark.parametrize(
     "data, expected",
     [